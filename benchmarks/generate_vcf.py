@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Generator of synthetic VCF files for benchmarking SmartCombineVariants.
+Every input file has the same samples. A part of sites (overlap) is shared by all input files, the other sites are
+unique to one input file. Shared sites have FORMAT with or without GQ, so a part of them is merged.
+
+Usage:
+    generate_vcf.py -o <directory> [options]
+
+Options:
+
+    -h --help
+    -o,--out <directory>                Directory for generated files
+    --name <name>                       Prefix of names of generated files [default: synthetic]
+    --inputs <inputs>                   Number of input files [default: 2]
+    --contigs <contigs>                 Number of contigs [default: 4]
+    --records <records>                 Number of records per contig in every input file [default: 10000]
+    --samples <samples>                 Number of samples [default: 2]
+    --overlap <overlap>                 Fraction of sites shared by all input files [default: 0.5]
+    --multiallelic <multiallelic>       Fraction of multi-allelic sites [default: 0.05]
+    --compressed                        Write BGZF compressed files with tabix index
+    --seed <seed>                       Seed of the random generator [default: 0]
+"""
+
+import os
+import random
+import sys
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bgzf_writer import Bgzf_writer
+from tabix_index_writer import Tabix_index_writer
+
+BASES = 'ACGT'
+CONTIG_LENGTH = 250000000
+
+
+def generate_sites(random_generator, number_of_sites, multiallelic):
+    """ Returns sorted list of sites (position, ref, alt) of one contig. """
+    step = max(CONTIG_LENGTH // max(number_of_sites, 1), 1)
+    sites = []
+    position = 0
+    for _ in range(number_of_sites):
+        position += random_generator.randint(1, 2 * step - 1)
+        ref = random_generator.choice(BASES)
+        alts = [base for base in BASES if base != ref]
+        if random_generator.random() < multiallelic:
+            alt = ','.join(sorted(random_generator.sample(alts, 2)))
+        else:
+            alt = random_generator.choice(alts)
+        sites.append((position, ref, alt))
+    return sites
+
+
+def header(contigs, samples):
+    """ Returns header of generated files. """
+    lines = ['##fileformat=VCFv4.2\n',
+             '##INFO=<ID=DP,Number=1,Type=Integer,Description="Total Depth">\n',
+             '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">\n',
+             '##INFO=<ID=SRC,Number=1,Type=Integer,Description="Generated input file">\n',
+             '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n',
+             '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read Depth">\n',
+             '##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">\n']
+    lines.extend(f'##contig=<ID={contig},length={CONTIG_LENGTH}>\n' for contig in contigs)
+    lines.append('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t' + '\t'.join(samples) + '\n')
+    return ''.join(lines)
+
+
+def record(random_generator, contig, site, samples, input_index, with_gq):
+    """ Returns one body line. """
+    position, ref, alt = site
+    values = []
+    for _ in samples:
+        genotype = random_generator.choice(('0/1', '1/1', '0/0'))
+        if with_gq:
+            values.append(f'{genotype}:{random_generator.randint(5, 60)}:{random_generator.randint(1, 99)}')
+        else:
+            values.append(f'{genotype}:{random_generator.randint(5, 60)}')
+    return f'{contig}\t{position}\t.\t{ref}\t{alt}\t{random_generator.randint(10, 999)}\tPASS\t' \
+           f'AF={random_generator.random():.3f};DP={random_generator.randint(10, 500)};SRC={input_index}\t' \
+           f'{"GT:DP:GQ" if with_gq else "GT:DP"}\t' + '\t'.join(values) + '\n'
+
+
+def generate_vcf_files(directory, name='synthetic', inputs=2, contigs=4, records=10000, samples=2, overlap=0.5,
+                       multiallelic=0.05, compressed=False, seed=0):
+    """ Generates input files and returns their paths. """
+    random_generator = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    names_of_contigs = [str(contig + 1) for contig in range(contigs)]
+    names_of_samples = [f'SAMPLE{sample + 1}' for sample in range(samples)]
+    number_of_shared_sites = int(records * overlap)
+
+    sites_of_inputs = [{} for _ in range(inputs)]
+    for contig in names_of_contigs:
+        shared_sites = generate_sites(random_generator, number_of_shared_sites, multiallelic)
+        for sites_of_input in sites_of_inputs:
+            unique_sites = generate_sites(random_generator, records - number_of_shared_sites, multiallelic)
+            sites_of_input[contig] = sorted([(site, True) for site in shared_sites] +
+                                            [(site, False) for site in unique_sites])
+
+    paths = []
+    for input_index, sites_of_input in enumerate(sites_of_inputs):
+        path = os.path.join(directory, f'{name}_{input_index + 1}.vcf' + ('.gz' if compressed else ''))
+        if compressed:
+            output_file = Bgzf_writer(open(path, 'wb'))
+            tabix_index_writer = Tabix_index_writer()
+        else:
+            output_file = open(path, 'w')
+            tabix_index_writer = None
+
+        output_file.write(header(names_of_contigs, names_of_samples).encode('utf-8') if compressed else
+                          header(names_of_contigs, names_of_samples))
+        for contig in names_of_contigs:
+            for site, shared in sites_of_input[contig]:
+                with_gq = random_generator.random() < 0.5 if shared else True
+                line = record(random_generator, contig, site, names_of_samples, input_index + 1, with_gq)
+                if compressed:
+                    start = output_file.uncompressed_offset
+                    output_file.write(line.encode('utf-8'))
+                    beg, end = Tabix_index_writer.interval_of_vcf_record(site[0], site[1], '')
+                    tabix_index_writer.add_record(contig, beg, end, start, output_file.uncompressed_offset)
+                else:
+                    output_file.write(line)
+
+        output_file.close()
+        if tabix_index_writer is not None:
+            tabix_index_writer.write(path, output_file.virtual_offset)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    for path in generate_vcf_files(arguments['--out'], arguments['--name'], int(arguments['--inputs']),
+                                   int(arguments['--contigs']), int(arguments['--records']),
+                                   int(arguments['--samples']), float(arguments['--overlap']),
+                                   float(arguments['--multiallelic']), arguments['--compressed'],
+                                   int(arguments['--seed'])):
+        print(path)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmarks of SmartCombineVariants on synthetic VCF files.
+Every scenario generates input files (once, they are kept in the work directory), runs the whole
+Output_file.process_input_files pipeline and measures time of every stage. The best of repeated runs is kept.
+Results are written in the JSON file and compared with the baseline results if they are given.
+
+Usage:
+    run_benchmarks.py [options]
+
+Options:
+
+    -h --help
+    -o,--out <results.json>             JSON file with results [default: benchmark_results.json]
+    --baseline <baseline.json>          JSON file with results to compare with
+    --work_dir <work_dir>               Directory for generated input files and outputs [default: benchmark_data]
+    --scale <scale>                     Multiplier of the number of records in all scenarios [default: 1]
+    --repeat <repeat>                   Number of runs of every scenario [default: 3]
+    --scenario <scenario>               Comma separated names of scenarios to run, all scenarios by default
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import smart_combine_variants
+from generate_vcf import generate_vcf_files
+from output_file import Output_file
+
+SCENARIOS = {
+    'small': {'generator': {'inputs': 2, 'contigs': 4, 'records': 5000}, 'arguments': []},
+    'dense_overlap': {'generator': {'inputs': 2, 'contigs': 2, 'records': 25000, 'overlap': 0.9}, 'arguments': []},
+    'many_samples': {'generator': {'inputs': 2, 'contigs': 2, 'records': 5000, 'samples': 50}, 'arguments': []},
+    'many_inputs': {'generator': {'inputs': 20, 'contigs': 4, 'records': 1000, 'overlap': 0.2}, 'arguments': []},
+    'multiallelic': {'generator': {'inputs': 3, 'contigs': 2, 'records': 10000, 'multiallelic': 0.5},
+                     'arguments': []},
+    'compressed': {'generator': {'inputs': 2, 'contigs': 4, 'records': 10000, 'compressed': True},
+                   'arguments': ['-f', 'COMPRESSED']},
+    'streaming': {'generator': {'inputs': 2, 'contigs': 4, 'records': 10000}, 'arguments': ['--streaming']},
+}
+
+STAGES = {
+    'header_read': ['read_header_in_input_files', 'process_headers'],
+    'indexing': ['extract_chromosomes'],
+    'body_read': ['read_specific_chrom_in_input_files'],
+    'merge': ['merge_specific_chrom'],
+    'write': ['write_header_in_output_file', 'write_specific_chrom_in_output_file', 'write_chunk_in_output_file',
+              'close_output_file'],
+}
+
+
+def time_stages(output_file, stage_times):
+    """ Wraps methods of output_file, so their running time is added to the time of their stage. """
+    for stage, names_of_methods in STAGES.items():
+        for name in names_of_methods:
+            method = getattr(output_file, name)
+
+            def timed_method(*args, method=method, stage=stage, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    stage_times[stage] += time.perf_counter() - start
+
+            setattr(output_file, name, timed_method)
+
+
+def run_scenario(name, scenario, work_dir, scale):
+    """ Runs the scenario once and returns total time and times of stages. Stages that are not measured
+        separately (e.g. reading and merging in streaming mode) are in the time of stage other. """
+    generator_arguments = dict(scenario['generator'])
+    generator_arguments['records'] = max(int(generator_arguments['records'] * scale), 1)
+    input_directory = os.path.join(work_dir, f'{name}_x{scale}')
+    paths = generate_vcf_files(input_directory, name, **generator_arguments) \
+        if not os.path.isdir(input_directory) else sorted(os.path.join(input_directory, file_name)
+                                                          for file_name in os.listdir(input_directory)
+                                                          if file_name.endswith(('.vcf', '.vcf.gz')))
+    argv = [argument for path in paths for argument in ('-i', path)]
+    argv += ['-o', os.path.join(work_dir, f'{name}_output.vcf')] + scenario['arguments']
+    arguments = docopt(smart_combine_variants.__doc__, argv=argv)
+
+    stage_times = {stage: 0.0 for stage in STAGES}
+    start = time.perf_counter()
+    output_file = Output_file(arguments)
+    time_stages(output_file, stage_times)
+    if output_file.invalid is True or output_file.process_input_files() is False:
+        raise RuntimeError(f'Scenario {name} failed: {output_file.error_message}')
+    total = time.perf_counter() - start
+    stage_times['other'] = max(total - sum(stage_times.values()), 0.0)
+    return {'total': total, 'stages': stage_times, 'inputs': len(paths),
+            'records_per_input': generator_arguments['records'] * generator_arguments.get('contigs', 4)}
+
+
+def compare_with_baseline(results, baseline):
+    """ Prints ratio of times of every scenario and stage to the baseline. Ratio below 1 is a speedup. """
+    for name, result in results['scenarios'].items():
+        if name not in baseline.get('scenarios', {}):
+            continue
+        baseline_result = baseline['scenarios'][name]
+        print(f'{name}: total {result["total"]:.3f}s, {result["total"] / baseline_result["total"]:.2f}x baseline')
+        for stage, stage_time in result['stages'].items():
+            baseline_time = baseline_result['stages'].get(stage, 0.0)
+            if baseline_time > 0:
+                print(f'    {stage}: {stage_time:.3f}s, {stage_time / baseline_time:.2f}x baseline')
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    scale = float(arguments['--scale'])
+    repeat = int(arguments['--repeat'])
+    names_of_scenarios = arguments['--scenario'].split(',') if arguments['--scenario'] else list(SCENARIOS)
+    os.makedirs(arguments['--work_dir'], exist_ok=True)
+
+    results = {'python': platform.python_version(), 'platform': platform.platform(), 'scale': scale,
+               'repeat': repeat, 'scenarios': {}}
+    for name in names_of_scenarios:
+        runs = [run_scenario(name, SCENARIOS[name], arguments['--work_dir'], scale) for _ in range(repeat)]
+        results['scenarios'][name] = min(runs, key=lambda run: run['total'])
+        print(f'{name}: {results["scenarios"][name]["total"]:.3f}s', file=sys.stderr)
+
+    with open(arguments['--out'], 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+    if arguments['--baseline']:
+        with open(arguments['--baseline']) as baseline_file:
+            compare_with_baseline(results, json.load(baseline_file))
@@ -0,0 +1,232 @@
+import struct
+import zlib
+
+from collections import deque
+
+
+class Bgzf_reader:
+    """ Reader for BGZF files, the blocked gzip format written by bgzip and used by tabix.
+        Positions returned by tell() and accepted by seek() are virtual offsets: the compressed offset of
+        the BGZF block shifted left by 16 bits, combined with the offset inside the uncompressed block.
+        Seeking to a virtual offset decompresses only the block that contains it.
+        With more threads, blocks following the current one are read and decompressed ahead in a thread pool (zlib
+        releases the GIL) while the file is read sequentially, at most READ_AHEAD_BLOCKS_PER_THREAD blocks per
+        thread. Blocks are still returned in order, seeking to another block drops blocks read ahead. Every block is
+        checked against its CRC32, error of a block decompressed ahead is raised when the block is read.
+    """
+    BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+    HEADER_SIZE = 12
+    READ_AHEAD_BLOCKS_PER_THREAD = 4
+
+    def __init__(self, path, threads=1):
+        """ Create and initialize a Bgzf_reader.
+        :param path: path to the BGZF compressed file
+        :param threads: number of threads decompressing blocks ahead of reading, 1 decompresses blocks only when
+                        they are read
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        self.block_start = None
+        self.next_block_start = 0
+        self.block_data = b''
+        self.within_block_offset = 0
+        self.threads = threads
+        self.executor = None
+        self.max_read_ahead_blocks = threads * self.READ_AHEAD_BLOCKS_PER_THREAD
+        self.read_ahead_blocks = deque()
+        self.read_ahead_start = None
+
+    @staticmethod
+    def is_bgzf(path):
+        """ Checks whether the file starts with a BGZF block header (gzip member with BC extra subfield). """
+        with open(path, 'rb') as file:
+            header = file.read(18)
+        return len(header) == 18 and header[:4] == Bgzf_reader.BGZF_MAGIC and header[12:14] == b'BC'
+
+    @staticmethod
+    def make_virtual_offset(block_start, within_block_offset):
+        """ Combines compressed block offset and offset inside the uncompressed block into virtual offset. """
+        return (block_start << 16) | within_block_offset
+
+    @staticmethod
+    def split_virtual_offset(virtual_offset):
+        """ Splits virtual offset into compressed block offset and offset inside the uncompressed block. """
+        return virtual_offset >> 16, virtual_offset & 0xFFFF
+
+    def read_block(self, block_start):
+        """ Reads the compressed BGZF block that starts at the compressed offset block_start. Returns deflate data of
+            the block and offset of the next block, or None when there are no more blocks in the file.
+        """
+        self.file.seek(block_start)
+        header = self.file.read(self.HEADER_SIZE)
+        if len(header) < self.HEADER_SIZE:
+            return None
+
+        if header[:4] != self.BGZF_MAGIC:
+            raise ValueError(f'Invalid BGZF block at offset {block_start} in file: {self.path}')
+
+        extra_length = struct.unpack('<H', header[10:12])[0]
+        extra = self.file.read(extra_length)
+        block_size = None
+        index = 0
+        while index + 4 <= extra_length:
+            subfield_length = struct.unpack('<H', extra[index + 2:index + 4])[0]
+            if extra[index:index + 2] == b'BC':
+                block_size = struct.unpack('<H', extra[index + 4:index + 6])[0] + 1
+            index += 4 + subfield_length
+        if block_size is None:
+            raise ValueError(f'Missing BGZF block size at offset {block_start} in file: {self.path}')
+
+        data = self.file.read(block_size - self.HEADER_SIZE - extra_length)
+        return data, block_start + block_size
+
+    def inflate(self, block_start, data):
+        """ Decompresses deflate data of the block that starts at the compressed offset block_start and checks it
+            against CRC32 and size at the end of the block. ValueError is raised if the block is corrupt.
+        """
+        try:
+            block_data = zlib.decompress(data[:-8], -15)
+        except zlib.error as error:
+            raise ValueError(f'Corrupt BGZF block at offset {block_start} in file: {self.path}, {error}') from None
+        if len(data) < 8 or struct.unpack('<II', data[-8:]) != (zlib.crc32(block_data), len(block_data)):
+            raise ValueError(f'Corrupt BGZF block at offset {block_start} in file: {self.path}, CRC32 or size of '
+                             f'decompressed data doesn\'t match')
+        return block_data
+
+    def load_block(self, block_start):
+        """ Decompresses the BGZF block that starts at the compressed offset block_start, or takes it from blocks
+            read ahead. Returns False when there are no more blocks in the file. ValueError is raised if the block is
+            corrupt, also if it was decompressed ahead in the thread pool.
+        """
+        sequential = block_start == self.next_block_start
+        self.within_block_offset = 0
+        if len(self.read_ahead_blocks) > 0 and self.read_ahead_blocks[0][0] == block_start:
+            _, next_block_start, future = self.read_ahead_blocks.popleft()
+            block_data = future.result()
+        else:
+            self.drop_read_ahead_blocks()
+            block = self.read_block(block_start)
+            self.block_start = block_start
+            if block is None:
+                self.block_data = b''
+                self.next_block_start = block_start
+                return False
+            data, next_block_start = block
+            block_data = self.inflate(block_start, data)
+
+        self.block_start = block_start
+        self.block_data = block_data
+        self.next_block_start = next_block_start
+        if self.threads > 1 and sequential:
+            self.read_ahead()
+        return True
+
+    def read_ahead(self):
+        """ Reads blocks following the current one and submits them for decompression until the window of blocks
+            read ahead is full. Reading ahead stops at the end of file or at an invalid block, which is reported
+            when it is loaded. """
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        if len(self.read_ahead_blocks) == 0:
+            self.read_ahead_start = self.next_block_start
+        while len(self.read_ahead_blocks) < self.max_read_ahead_blocks:
+            try:
+                block = self.read_block(self.read_ahead_start)
+            except ValueError:
+                return
+            if block is None:
+                return
+            data, next_block_start = block
+            self.read_ahead_blocks.append((self.read_ahead_start, next_block_start,
+                                           self.executor.submit(self.inflate, self.read_ahead_start, data)))
+            self.read_ahead_start = next_block_start
+
+    def drop_read_ahead_blocks(self):
+        """ Cancels decompression of blocks read ahead, e.g. after seeking to another block. """
+        for _, _, future in self.read_ahead_blocks:
+            future.cancel()
+        self.read_ahead_blocks.clear()
+
+    def tell(self):
+        """ Returns virtual offset of the current position. Position at the end of a block is reported as the
+            start of the next block, same as htslib does. """
+        if self.block_start is None:
+            return self.make_virtual_offset(self.next_block_start, 0)
+        if self.within_block_offset >= len(self.block_data):
+            return self.make_virtual_offset(self.next_block_start, 0)
+        return self.make_virtual_offset(self.block_start, self.within_block_offset)
+
+    def seek(self, virtual_offset):
+        """ Moves to the virtual offset. The block is decompressed only if it is not the current one. """
+        block_start, within_block_offset = self.split_virtual_offset(virtual_offset)
+        if block_start != self.block_start:
+            self.load_block(block_start)
+        self.within_block_offset = within_block_offset
+        return virtual_offset
+
+    def readline(self):
+        """ Returns the next line including the newline character, or empty bytes at the end of file. """
+        chunks = []
+        while True:
+            if self.within_block_offset >= len(self.block_data):
+                if not self.load_block(self.next_block_start):
+                    break
+                continue
+            end = self.block_data.find(b'\n', self.within_block_offset)
+            if end == -1:
+                chunks.append(self.block_data[self.within_block_offset:])
+                self.within_block_offset = len(self.block_data)
+            else:
+                chunks.append(self.block_data[self.within_block_offset:end + 1])
+                self.within_block_offset = end + 1
+                break
+        return b''.join(chunks)
+
+    def iterate_lines_with_prefix(self, prefix):
+        """ Yields lines from the current position while they start with prefix and stops at the first line that
+            doesn't, leaving the position at its start. Complete lines of the decompressed block are split all at
+            once, only the line continuing in the next block is read with readline.
+        :param prefix: bytes every yielded line starts with
+        """
+        while True:
+            if self.within_block_offset >= len(self.block_data):
+                if not self.load_block(self.next_block_start):
+                    return
+                continue
+            last_newline = self.block_data.rfind(b'\n', self.within_block_offset)
+            if last_newline == -1:
+                start = self.tell()
+                line = self.readline()
+                if not line.startswith(prefix):
+                    self.seek(start)
+                    return
+                yield line
+                continue
+            offset = self.within_block_offset
+            for line in self.block_data[offset:last_newline].split(b'\n'):
+                if not line.startswith(prefix):
+                    self.within_block_offset = offset
+                    return
+                offset += len(line) + 1
+                self.within_block_offset = offset
+                yield line + b'\n'
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def close(self):
+        self.drop_read_ahead_blocks()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
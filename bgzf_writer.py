@@ -0,0 +1,146 @@
+import struct
+import zlib
+
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+
+class Bgzf_writer:
+    """ Writer of BGZF files that is kept open for the whole output file.
+        Written data is buffered and compressed in full BGZF blocks, already compressed BGZF blocks can be appended
+        as they are. The end of file block is written only once, when the writer is closed.
+        With more than one thread blocks are compressed in a thread pool (zlib releases the GIL) while the caller
+        keeps producing data. Blocks are written in order and at most PENDING_BLOCKS_PER_THREAD blocks per thread
+        wait for compression.
+        The writer remembers where every block starts, so offsets in the uncompressed data can be converted to
+        virtual offsets, also after the writer is closed.
+    """
+    PENDING_BLOCKS_PER_THREAD = 4
+    BLOCK_DATA_SIZE = 0xff00
+    HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+    EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+    def __init__(self, fileobj, compression_level=6, threads=1, close_fileobj=True):
+        """ Create and initialize a Bgzf_writer.
+        :param fileobj: binary file object the BGZF blocks are written to
+        :param compression_level: zlib compression level of blocks
+        :param threads: number of threads compressing blocks
+        :param close_fileobj: False if fileobj is only flushed when the writer is closed
+        """
+        self.fileobj = fileobj
+        self.close_fileobj = close_fileobj
+        self.compression_level = compression_level
+        self.buffer = bytearray()
+        self.closed = False
+        self.executor = None
+        if threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.max_pending_blocks = threads * self.PENDING_BLOCKS_PER_THREAD
+        self.pending_blocks = deque()
+        self.uncompressed_offset = 0
+        self.written_uncompressed_offset = 0
+        self.compressed_offset = 0
+        self.blocks_uncompressed_starts = array('q')
+        self.blocks_compressed_starts = array('q')
+
+    @staticmethod
+    def compress_block(data, compression_level=6):
+        """ Compresses up to BLOCK_DATA_SIZE bytes of data into one BGZF block. """
+        compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+        compressed_data = compressor.compress(data) + compressor.flush()
+        return Bgzf_writer.HEADER + struct.pack('<H', len(compressed_data) + 25) + compressed_data + \
+            struct.pack('<II', zlib.crc32(data), len(data))
+
+    @staticmethod
+    def compress_to_blocks(data, compression_level=6):
+        """ Compresses data into BGZF blocks without the end of file block, so blocks can be concatenated. """
+        return b''.join(Bgzf_writer.compress_block(data[start:start + Bgzf_writer.BLOCK_DATA_SIZE], compression_level)
+                        for start in range(0, len(data), Bgzf_writer.BLOCK_DATA_SIZE))
+
+    def write(self, data):
+        """ Buffers data and compresses every full block. """
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        self.buffer.extend(data)
+        self.uncompressed_offset += len(data)
+        if len(self.buffer) >= self.BLOCK_DATA_SIZE:
+            self.compress_buffer(False)
+
+    def write_blocks(self, blocks):
+        """ Appends already compressed BGZF blocks after the data written so far. """
+        self.compress_buffer(True)
+        self.write_pending_blocks(0)
+        start = 0
+        while start < len(blocks):
+            block_size = struct.unpack_from('<H', blocks, start + 16)[0] + 1
+            data_size = struct.unpack_from('<I', blocks, start + block_size - 4)[0]
+            self.write_block(blocks[start:start + block_size], data_size)
+            self.uncompressed_offset += data_size
+            start += block_size
+
+    def write_block(self, block, data_size):
+        """ Writes one compressed block and remembers where it starts. """
+        self.blocks_uncompressed_starts.append(self.written_uncompressed_offset)
+        self.blocks_compressed_starts.append(self.compressed_offset)
+        self.fileobj.write(block)
+        self.written_uncompressed_offset += data_size
+        self.compressed_offset += len(block)
+
+    def compress_buffer(self, include_partial_block):
+        """ Compresses and writes full blocks from the buffer, and the remaining partial block if requested. """
+        end = len(self.buffer) if include_partial_block else \
+            len(self.buffer) - len(self.buffer) % self.BLOCK_DATA_SIZE
+        if end == 0:
+            return
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        for start in range(0, len(data), self.BLOCK_DATA_SIZE):
+            block_data = data[start:start + self.BLOCK_DATA_SIZE]
+            if self.executor is None:
+                self.write_block(self.compress_block(block_data, self.compression_level), len(block_data))
+            else:
+                self.pending_blocks.append((self.executor.submit(self.compress_block, block_data,
+                                                                 self.compression_level), len(block_data)))
+                self.write_pending_blocks(self.max_pending_blocks)
+
+    def write_pending_blocks(self, max_pending_blocks):
+        """ Writes compressed blocks in order until at most max_pending_blocks blocks are waiting. """
+        while len(self.pending_blocks) > max_pending_blocks:
+            future, data_size = self.pending_blocks.popleft()
+            self.write_block(future.result(), data_size)
+
+    def virtual_offset(self, uncompressed_offset):
+        """ Converts offset in the uncompressed data into virtual offset. Valid only for data that has already
+            been compressed and written, e.g. after the writer is closed. """
+        index = bisect_right(self.blocks_uncompressed_starts, uncompressed_offset) - 1
+        if index < 0:
+            return 0
+        return (self.blocks_compressed_starts[index] << 16) | \
+            (uncompressed_offset - self.blocks_uncompressed_starts[index])
+
+    def flush(self):
+        self.compress_buffer(True)
+        self.write_pending_blocks(0)
+        self.fileobj.flush()
+
+    def close(self):
+        """ Writes the remaining data and the end of file block and closes the file. """
+        if not self.closed:
+            self.compress_buffer(True)
+            self.write_pending_blocks(0)
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.fileobj.write(self.EOF_BLOCK)
+            if self.close_fileobj:
+                self.fileobj.close()
+            else:
+                self.fileobj.flush()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -13,6 +13,8 @@ class Body_header_line:
         self.invalid = None
         self.error_message = None
         self.position = None
+        self.columns_of_samples_to_be_combined = None
+        self.keeps_all_samples = False
         if line != "":
             self.extract_sample_names()
             self.update_line()
@@ -25,6 +27,18 @@ class Body_header_line:
             self.has_format_field = True
             self.samples_names = splitted_line[9:]
 
+    def set_columns_of_samples_to_be_combined(self, list_of_samples_to_be_combined):
+        """ Finds indexes of fields of body lines with samples to be combined, in the order of
+            list_of_samples_to_be_combined. Samples missing in the line are skipped. Sets keeps_all_samples to True if
+            the projection keeps all samples in the same order, i.e. the sample fields of body lines are unchanged.
+        :param list_of_samples_to_be_combined: names of samples in the order of the output file
+        """
+        column_of_sample = {sample: index for index, sample in enumerate(self.samples_names, 9)}
+        self.columns_of_samples_to_be_combined = [column_of_sample[sample] for sample in
+                                                  list_of_samples_to_be_combined if sample in column_of_sample]
+        self.keeps_all_samples = self.columns_of_samples_to_be_combined == list(
+            range(9, 9 + len(self.samples_names)))
+
     def update_line(self):
         """ Updates the line according to the changes. """
         self.line = f'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'
@@ -1,15 +1,26 @@
 class Body_record:
-    """ Class representing a line in the body part of the VCF file. """
+    """ Class representing a line in the body part of the VCF file.
+        The line is kept as bytes read from the input file. Only fields from CHROM to FORMAT are decoded, sample
+        fields stay bytes and are split only when samples have to be adjusted. INFO is parsed into data_from_info
+        only when it is needed for merging, and the line is rebuilt only when a field changed, INFO has to be sorted
+        or samples have to be adjusted. Otherwise the original bytes are written in the output file as they are.
+    """
+    __slots__ = ('line', 'raw_line', 'fields', 'samples_part_of_line', 'chrom', 'pos', 'id', 'ref', 'alt', 'qual',
+                 'filter', 'info', 'format', 'has_format_field', 'invalid', 'sort_key', 'body_header_line',
+                 '_data_from_info', '_info_is_sorted', '_line_fingerprint', '_samples_fingerprint')
     list_of_samples_to_be_combined = []
 
     def __init__(self, line, body_header_line):
         """ Create and initialize a new Body_record.
-        :param line:  line in the body part of the VCF file. Mold for this class.
+        :param line:  line in the body part of the VCF file as bytes. Mold for this class.
         :param body_header_line: Header line in the corresponding VCF file.
         """
         self.line = line
-        if '\n' not in line:
-            self.line = line + '\n'
+        if not line.endswith(b'\n'):
+            self.line = line + b'\n'
+        self.raw_line = self.line
+        self.fields = []
+        self.samples_part_of_line = None
         self.chrom = ''
         self.pos = 0
         self.id = ''
@@ -17,39 +28,158 @@ class Body_record:
         self.alt = ''
         self.qual = ''
         self.filter = ''
-        self.filter_data = []
         self.info = ''
         self.format = ''
         self.has_format_field = False
         self.invalid = True
-        self.samples = {}
-        self.data_from_info = {}
+        self.sort_key = None
         self.body_header_line = body_header_line
+        self._data_from_info = None
+        self._info_is_sorted = None
+        self._line_fingerprint = None
+        self._samples_fingerprint = None
         self.extract_data_from_line()
-        self.extract_data_from_info()
+
+    @property
+    def samples(self):
+        """ Dictionary that maps sample names from the body header line to the sample fields of the line. """
+        samples = {}
+        if self.has_format_field:
+            sample_fields = self.sample_fields()
+            for index, sample in enumerate(self.body_header_line.samples_names):
+                samples[sample] = str(sample_fields[index], 'utf-8')
+        return samples
+
+    def sample_fields(self):
+        """ Sample fields of the original line as bytes. """
+        return self.samples_part_of_line.split(b'\t') if self.samples_part_of_line is not None else []
+
+    def columns_of_samples_to_be_combined(self):
+        """ Indexes of fields with samples to be combined, computed once per body header line of the input file. """
+        if self.body_header_line.columns_of_samples_to_be_combined is None:
+            self.body_header_line.set_columns_of_samples_to_be_combined(Body_record.list_of_samples_to_be_combined)
+        return self.body_header_line.columns_of_samples_to_be_combined
+
+    @property
+    def line_fingerprint(self):
+        """ 64-bit hash of the line bytes, records with different fingerprints have different lines. Computed on the
+            first access after the line is updated. """
+        if self._line_fingerprint is None:
+            self._line_fingerprint = hash(self.line)
+        return self._line_fingerprint
+
+    @property
+    def samples_fingerprint(self):
+        """ 64-bit hash of FORMAT and sample fields of the line, records with different fingerprints differ in FORMAT
+            or in some sample. Computed on the first access, after the line is adjusted to the samples to be
+            combined. """
+        if self._samples_fingerprint is None:
+            self._samples_fingerprint = hash(self.line.split(b'\t', 8)[8] if self.has_format_field else b'')
+        return self._samples_fingerprint
+
+    @property
+    def data_from_info(self):
+        """ Info data separated on ; and = and sorted by key. Parsed on the first access. """
+        if self._data_from_info is None:
+            self.extract_data_from_info()
+        return self._data_from_info
 
     def update_line(self):
         """ Updates line attributes if there are any changes in the fields of the line.
-            This line attribute will be written in the output file, so it has to be well-formatted and up to date. """
-        self.line = self.chrom + '\t' + str(
-            self.pos) + '\t' + self.id + '\t' + self.ref + '\t' + self.alt + '\t' + self.qual + '\t' + str(self.filter) + '\t' + str(self.info)
+            This line attribute will be written in the output file, so it has to be well-formatted and up to date.
+            Only changed fields are encoded, the original bytes are kept for unchanged fields and samples. """
+        self._line_fingerprint = None
+        if self.is_line_unchanged():
+            self.line = self.raw_line
+            self.invalid = len(self.body_header_line.samples_names) == 0
+            return self.line
 
-        if self.has_format_field:
-            self.line += '\t' + self.format
+        if self.info == self.fields[7] and not self.is_info_sorted():
+            self.update_info_field()
+
+        if self.is_site_unchanged():
+            line = self.site_part_of_line()
+        else:
+            line = self.chrom + '\t' + str(
+                self.pos) + '\t' + self.id + '\t' + self.ref + '\t' + self.alt + '\t' + self.qual + '\t' + str(self.filter) + '\t' + str(self.info)
+            if self.has_format_field:
+                line += '\t' + self.format
+            line = line.encode('utf-8')
 
-        for sample in Body_record.list_of_samples_to_be_combined:
-            if sample in self.samples.keys():
-                self.line += '\t' + self.samples[sample]
+        if self.has_format_field:
+            sample_fields = self.sample_fields()
+            columns = self.columns_of_samples_to_be_combined()
+            line += b''.join([b'\t' + sample_fields[column - 9] for column in columns])
+            if len(columns) > 0:
                 self.invalid = False
 
-        self.line += '\n'
+        self.line = line + b'\n'
 
         return self.line
 
+    def is_line_unchanged(self):
+        """ Checks whether the line written in the output is the same as the original line: no field was changed,
+            INFO is already sorted and all samples are kept in the same order. """
+        if not self.is_site_unchanged():
+            return False
+
+        samples_names = self.body_header_line.samples_names
+        if not self.has_format_field:
+            return len(samples_names) == 0
+        number_of_sample_fields = self.samples_part_of_line.count(b'\t') + 1 \
+            if self.samples_part_of_line is not None else 0
+        if number_of_sample_fields != len(samples_names):
+            return False
+        self.columns_of_samples_to_be_combined()
+        return self.body_header_line.keeps_all_samples
+
+    def is_site_unchanged(self):
+        """ Checks whether fields from CHROM to INFO are the same as in the original line and INFO is already
+            sorted. """
+        if (self.chrom, self.pos, self.id, self.ref, self.alt, self.qual, self.filter, self.info) != \
+                tuple(self.fields[:8]):
+            return False
+        return self.is_info_sorted()
+
+    def site_part_of_line(self):
+        """ Bytes of the original line from CHROM to FORMAT. """
+        if self.samples_part_of_line is None:
+            return self.raw_line[:-1]
+        return self.raw_line[:len(self.raw_line) - len(self.samples_part_of_line) - 2]
+
+    def is_info_sorted(self):
+        """ Checks whether the original info field is already in the form update_info_field would produce: keys are
+            sorted and unique, and there are no empty or True/False values. """
+        if self._info_is_sorted is None:
+            self._info_is_sorted = True
+            previous_key = None
+            for item in self.fields[7].split(';'):
+                if item.count('=') == 1:
+                    key, value = item.split('=')
+                    if value == '' or value == 'True' or value == 'False':
+                        self._info_is_sorted = False
+                        break
+                else:
+                    key = item
+                if previous_key is not None and key <= previous_key:
+                    self._info_is_sorted = False
+                    break
+                previous_key = key
+        return self._info_is_sorted
+
     def extract_data_from_line(self):
-        """ Get separate fields in line according to the Header line for the body. """
-        self.line = self.line.replace('\n', '')
-        fields_in_body_record = self.line.split('\t')
+        """ Get separate fields in line according to the Header line for the body. Fields up to FORMAT are decoded,
+            the rest of the line with sample fields is kept as bytes in samples_part_of_line. ValueError is raised if
+            POS is not a number. """
+        line = self.line
+        fields = line.split(b'\t', 9)
+        if len(fields) > 9:
+            self.samples_part_of_line = fields[9][:-1]
+            line = line[:len(line) - len(fields[9]) - 1]
+        else:
+            line = line[:-1]
+        self.fields = str(line, 'utf-8').split('\t')
+        fields_in_body_record = self.fields
         self.chrom = fields_in_body_record[0]
         self.pos = fields_in_body_record[1]
         self.id = fields_in_body_record[2]
@@ -58,45 +188,45 @@ class Body_record:
         self.qual = fields_in_body_record[5]
         self.filter = fields_in_body_record[6]
         self.info = fields_in_body_record[7]
+        try:
+            self.sort_key = int(self.pos)
+        except ValueError:
+            raise ValueError(f'POS {self.pos} is not a number') from None
 
         if len(fields_in_body_record) > 8:
             self.has_format_field = True
             self.format = fields_in_body_record[8]
-            index = 8
-            for sample in self.body_header_line.samples_names:
-                index += 1
-                self.samples[sample] = fields_in_body_record[index]
 
     def extract_data_from_info(self):
         """ Separate info data, based on the = (equal sign).
-            Separated data is sorted. Update the info field and line because changes occurred.
+            Separated data is sorted.
         """
+        data_from_info = {}
         attributes = self.info.split(';')
         for item in attributes:
             if item.count('=') == 1:
                 splitted = item.split('=')
-                self.data_from_info[splitted[0]] = splitted[1]
+                data_from_info[splitted[0]] = splitted[1]
                 splitted.clear()
             else:
-                self.data_from_info[item] = True
+                data_from_info[item] = True
 
-        self.data_from_info = dict(sorted(self.data_from_info.items()))
-        self.update_info_field()
-        self.update_line()
+        self._data_from_info = dict(sorted(data_from_info.items()))
 
     def update_data_from_info(self, data_from_info):
         """ Setter for attribute data_from_info.
         :param data_from_info:
         :return:
         """
-        self.data_from_info = dict(sorted(data_from_info.items()))
+        self._data_from_info = dict(sorted(data_from_info.items()))
         self.update_info_field()
 
     def update_info_field(self):
         """ Updates info field according to the specific information in the attribute
             data_from_info and rules for formatting info field in VCF files."""
+        data_from_info = self.data_from_info
         self.info = ''
-        for key, value in self.data_from_info.items():
+        for key, value in data_from_info.items():
             if value != '':
                 if str(value) == 'True' or str(value) == 'False':
                     self.info += key + ';'
@@ -104,11 +234,9 @@ class Body_record:
                     self.info += key + '=' + str(value) + ';'
 
         self.info = self.info[:-1]
-        self.update_line()
 
     def __eq__(self, other):
         """ Overridden equal operator. Comparing is done by line attribute.
             :param other: other Generic_header to be compared with.
         """
         return self.line == other.line
-
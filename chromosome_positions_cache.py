@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+
+
+class Chromosome_positions_cache:
+    """ Persistent cache of positions of chromosomes in input files, stored as one JSON file per input file in the
+        cache directory. Entry is valid only while path, size, modification time and header hash of the input file
+        are unchanged. Stale entries are removed when found, and least recently used entries are evicted when the
+        size of the cache directory exceeds the limit.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=100):
+        """ Create and initialize a Chromosome_positions_cache.
+        :param cache_dir: directory where cache entries are stored, created if it doesn't exist
+        :param max_size_mb: maximal size of all cache entries in megabytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = int(float(max_size_mb) * 1024 * 1024)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def entry_path(self, path):
+        """ Returns path of the cache entry for the input file. """
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    @staticmethod
+    def file_signature(input_file):
+        """ Returns values that have to match for the cache entry of input_file to be valid. """
+        stat = os.stat(input_file.path)
+        return {'path': os.path.abspath(input_file.path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                'header_hash': input_file.header_hash()}
+
+    def load(self, input_file):
+        """ Fills chromosomes_positions and chromosomes_records_count of input_file from the cache.
+            Returns False if there is no valid entry for input_file. """
+        entry_path = self.entry_path(input_file.path)
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return False
+
+        if entry.get('signature') != self.file_signature(input_file):
+            self.remove(entry_path)
+            return False
+
+        input_file.chromosomes_positions = entry['chromosomes_positions']
+        input_file.chromosomes_records_count = entry['chromosomes_records_count']
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return True
+
+    def store(self, input_file):
+        """ Writes chromosomes_positions and chromosomes_records_count of input_file in the cache and evicts least
+            recently used entries if the cache is too big. """
+        entry = {'signature': self.file_signature(input_file),
+                 'chromosomes_positions': input_file.chromosomes_positions,
+                 'chromosomes_records_count': input_file.chromosomes_records_count}
+        entry_path = self.entry_path(input_file.path)
+        temporary_path = f'{entry_path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'w') as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temporary_path, entry_path)
+        except OSError:
+            self.remove(temporary_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """ Removes least recently used entries until the size of the cache is below the limit. """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self.remove(os.path.join(self.cache_dir, name))
+            total_size -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,78 @@
+from output_file import Output_file
+
+OPTIONS = ('reference_index', 'regions', 'regions_file', 'cache_dir', 'cache_size', 'streaming', 'max_open_files',
+           'processes', 'threads', 'decompression_threads', 'metrics', 'profile', 'header_only')
+WRITING_OPTIONS = ('processes', 'threads', 'metrics', 'profile')
+
+
+def combine_arguments(inputs, samples=None, keep_different_format=False, output_format='SAME_AS_INPUT', **options):
+    """ Returns dictionary of arguments for Output_file in the form docopt would create it from the command line.
+    :param inputs: paths to input VCF files
+    :param samples: names of samples to be combined, all samples by default
+    :param keep_different_format: keep variants with same CHROM, POS, REF and ALT, but different FORMAT
+    :param output_format: COMPRESSED, UNCOMPRESSED or SAME_AS_INPUT
+    :param options: other options of the command line without leading dashes, e.g. streaming=True
+    """
+    unknown_options = [option for option in options if option not in OPTIONS]
+    if len(unknown_options) > 0:
+        raise TypeError(f'Unknown options: {", ".join(unknown_options)}')
+    if isinstance(samples, (list, tuple)):
+        samples = ','.join(samples)
+    if isinstance(options.get('regions'), (list, tuple)):
+        options['regions'] = ','.join(options['regions'])
+
+    arguments = {'--input_file': list(inputs), '--sample_name': samples or None, '--output_format': output_format,
+                 '--out': None, '--keep_variants_with_different_format': keep_different_format, '--verbose': False}
+    for option, value in options.items():
+        arguments['--' + option] = value
+    return arguments
+
+
+def combine(inputs, samples=None, keep_different_format=False, lines=False, header=False, **options):
+    """ Combines input VCF files and lazily yields merged records in the order of the output file, without writing
+        any file. Records of one chromosome are merged when the first record of the chromosome is requested (or one
+        position at a time with streaming=True). ValueError is raised if input files are invalid.
+        Samples of records are shared through class attributes, so only one combining can run in a process at a time.
+    :param inputs: paths to input VCF files
+    :param samples: names of samples to be combined, all samples by default
+    :param keep_different_format: keep variants with same CHROM, POS, REF and ALT, but different FORMAT
+    :param lines: yield lines of the output file instead of Body_record objects
+    :param header: with lines=True, yield the merged header first
+    :param options: other options of the command line without leading dashes, e.g. streaming=True, regions='chr1'.
+                    Options of writing the output file (WRITING_OPTIONS) are not accepted, TypeError is raised.
+    """
+    writing_options = [option for option in options if option in WRITING_OPTIONS]
+    if len(writing_options) > 0:
+        raise TypeError(f'Options used only by write_combined: {", ".join(writing_options)}')
+    output_file = Output_file(combine_arguments(inputs, samples, keep_different_format, **options))
+    if output_file.invalid is True:
+        raise ValueError(output_file.error_message)
+
+    try:
+        if not output_file.prepare_input_files():
+            raise ValueError(output_file.error_message)
+        if lines and header:
+            yield output_file.header_text()
+        for body_record in output_file.iterate_merged_body_records():
+            yield str(body_record.line, 'utf-8') if lines else body_record
+    finally:
+        output_file.file_handle_pool.close()
+    if output_file.invalid is True:
+        raise ValueError(output_file.error_message)
+
+
+def write_combined(inputs, sink, samples=None, keep_different_format=False, compressed=False, **options):
+    """ Combines input VCF files and writes the output VCF in the binary sink, e.g. a file opened with 'wb', a socket
+        file or io.BytesIO. The sink is flushed, but not closed. ValueError is raised if input files are invalid.
+    :param inputs: paths to input VCF files
+    :param sink: binary file object
+    :param samples: names of samples to be combined, all samples by default
+    :param keep_different_format: keep variants with same CHROM, POS, REF and ALT, but different FORMAT
+    :param compressed: write BGZF compressed output
+    :param options: other options of the command line without leading dashes, e.g. streaming=True
+    """
+    output_format = 'COMPRESSED' if compressed else 'UNCOMPRESSED'
+    output_file = Output_file(combine_arguments(inputs, samples, keep_different_format, output_format, **options),
+                              sink)
+    if output_file.invalid is True or output_file.process_input_files() is False:
+        raise ValueError(output_file.error_message)
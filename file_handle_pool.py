@@ -0,0 +1,102 @@
+import os
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class File_handle_pool:
+    """ Pool of open handles of input files shared by all input files. Handles are reused across chromosomes instead
+        of opening the file for every chromosome, and at most max_open_files handles are kept open: when the limit is
+        reached the least recently used idle handle is closed. A handle is never shared by two readers at the same
+        time, a second reader of the same file gets its own handle. Handles inherited by a forked process are
+        dropped, because the forked process shares their file offsets with the parent.
+    """
+    DEFAULT_MAX_OPEN_FILES = 256
+
+    def __init__(self, max_open_files=DEFAULT_MAX_OPEN_FILES):
+        """ Create and initialize a File_handle_pool.
+        :param max_open_files: maximal number of idle and used handles open at the same time
+        """
+        self.max_open_files = max_open_files
+        self.idle_handles = OrderedDict()
+        self.number_of_open_handles = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def handle(self, key, open_file):
+        """ Context manager lending an open handle of the file.
+        :param key: identifier of the file, e.g. its path
+        :param open_file: function opening a new handle of the file
+        """
+        handle = self.acquire(key, open_file)
+        try:
+            yield handle
+        except Exception:
+            self.discard(handle)
+            raise
+        except BaseException:
+            self.release(key, handle)
+            raise
+        else:
+            self.release(key, handle)
+
+    def acquire(self, key, open_file):
+        """ Returns an idle handle of the file or opens a new one, closing least recently used idle handles if the
+            limit of open handles is reached. """
+        with self.lock:
+            self.drop_handles_after_fork()
+            handles = self.idle_handles.get(key)
+            if handles:
+                handle = handles.pop()
+                if len(handles) == 0:
+                    del self.idle_handles[key]
+                return handle
+            while self.number_of_open_handles >= self.max_open_files and len(self.idle_handles) > 0:
+                _, handles = self.idle_handles.popitem(last=False)
+                for idle_handle in handles:
+                    idle_handle.close()
+                    self.number_of_open_handles -= 1
+            self.number_of_open_handles += 1
+        try:
+            return open_file()
+        except BaseException:
+            with self.lock:
+                self.number_of_open_handles -= 1
+            raise
+
+    def release(self, key, handle):
+        """ Returns the handle to the pool as the most recently used one. """
+        with self.lock:
+            if self.pid != os.getpid():
+                handle.close()
+                return
+            self.idle_handles.setdefault(key, []).append(handle)
+            self.idle_handles.move_to_end(key)
+
+    def discard(self, handle):
+        """ Closes the handle that can't be reused, e.g. after an error while reading. """
+        with self.lock:
+            handle.close()
+            if self.pid == os.getpid():
+                self.number_of_open_handles -= 1
+
+    def drop_handles_after_fork(self):
+        """ Forgets handles inherited from the parent process. They are closed only in this process. """
+        if self.pid != os.getpid():
+            for handles in self.idle_handles.values():
+                for handle in handles:
+                    handle.close()
+            self.idle_handles.clear()
+            self.number_of_open_handles = 0
+            self.pid = os.getpid()
+
+    def close(self):
+        """ Closes all idle handles. """
+        with self.lock:
+            for handles in self.idle_handles.values():
+                for handle in handles:
+                    handle.close()
+                    self.number_of_open_handles -= 1
+            self.idle_handles.clear()
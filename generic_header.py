@@ -1,36 +1,48 @@
 class Generic_header:
     """ Represents line in the header of the VCF file.
-        Contains all relevant information about line and methods for manipulation. """
+        Contains all relevant information about line and methods for manipulation.
+        Only tag and ID are extracted when the object is created, other attributes are parsed into data on the first
+        access. """
     def __init__(self, line):
         self.line = line
         self.tag = ""
         self.ID = None
         self.tag_and_ID = ""
-        self.data = {}
+        self._data = None
         self.extract_line_data()
 
-    def extract_line_data(self):
-        """ If possible divides the line into two parts at the place of = (equal sign).
-            Sets ID and tag name. """
-        try:
-            line_parse = self.line.split('=', 1)
-            self.tag = (line_parse[0])[2:]
-            attributes = line_parse[1].split(',')
-            for item in attributes:
+    @property
+    def data(self):
+        """ Attributes of the line separated on , and = """
+        if self._data is None:
+            self._data = {}
+            for item in self.attributes():
                 if item.count('=') >= 1:
                     splitted = item.split('=', 1)
-                    self.data[splitted[0].lstrip('<,"')] = splitted[1].rstrip('>')
+                    self._data[splitted[0].lstrip('<,"')] = splitted[1].rstrip('>')
+        return self._data
 
-            if 'ID' in self.data:
-                self.ID = self.data['ID']
-                self.tag_and_ID = f'{self.tag}_{self.ID}'
+    def attributes(self):
+        """ Returns part of the line after the tag split on , (comma). """
+        line_parse = self.line.split('=', 1)
+        return line_parse[1].split(',') if len(line_parse) > 1 else []
 
-        finally:
-            pass
+    def extract_line_data(self):
+        """ If possible divides the line into two parts at the place of = (equal sign).
+            Sets ID and tag name. If the ID attribute is given more than once, the last one is used. """
+        tag, _, value = self.line.partition('=')
+        self.tag = tag[2:]
+        if 'ID=' not in value:
+            return
+        for item in reversed(value.split(',')):
+            key, separator, attribute_value = item.partition('=')
+            if separator and key.lstrip('<,"') == 'ID':
+                self.ID = attribute_value.rstrip('>')
+                self.tag_and_ID = f'{self.tag}_{self.ID}'
+                return
 
     def __eq__(self, other):
         """ Overridden equal operator. Comparing is done by line attribute.
             :param other: other Generic_header to be compared with.
         """
         return self.line == other.line
-
@@ -0,0 +1,61 @@
+class Header_registry:
+    """ Merges header lines of all input files in a single pass. Lines with ID are indexed by (tag, ID), so
+        duplicates are found with one dictionary lookup and the first definition is kept. Different lines with the same
+        tag and ID are reported as conflicts. Lines without ID and ##contig lines are deduplicated by the whole line,
+        ##contig lines with the same ID and a different line are reported as conflicts too.
+    """
+
+    def __init__(self):
+        """ Create and initialize Header_registry. """
+        self.headers_with_ID = {}
+        self.headers_without_ID = {}
+        self.contigs = {}
+        self.contig_lines = {}
+        self.conflicts = []
+
+    def add_input_file(self, input_file):
+        """ Adds all header lines of the input file whose header has been read.
+        :param input_file: Input_file
+        """
+        for header_object in input_file.list_of_header_objects:
+            self.add_header_with_ID(header_object, input_file.path)
+        for header_object in input_file.list_of_header_objects_without_ID:
+            self.headers_without_ID.setdefault(header_object.line, header_object)
+        for header_object in input_file.list_of_contigs:
+            self.add_contig(header_object, input_file.path)
+
+    def add_header_with_ID(self, header_object, path):
+        """ Adds the header line with ID other than ##contig, the first definition of the tag and ID is kept. """
+        key = (header_object.tag, header_object.ID)
+        registered = self.headers_with_ID.setdefault(key, header_object)
+        if registered.line != header_object.line:
+            self.conflicts.append(f'Conflicting definitions of {header_object.tag} ID={header_object.ID} in {path}, '
+                                  f'{registered.line.rstrip()} is used.')
+
+    def add_contig(self, header_object, path):
+        """ Adds the ##contig header line, all different lines are kept in the order they were first seen. """
+        if header_object.line in self.contigs:
+            return
+        self.contigs[header_object.line] = header_object
+        registered_line = self.contig_lines.setdefault(header_object.ID, header_object.line)
+        if registered_line != header_object.line:
+            self.conflicts.append(f'Conflicting definitions of contig ID={header_object.ID} in {path}: '
+                                  f'{registered_line.rstrip()} and {header_object.line.rstrip()}.')
+
+    def header_objects_without_ID(self):
+        """ Returns unique header lines without ID. """
+        return list(self.headers_without_ID.values())
+
+    def list_of_contigs(self):
+        """ Returns unique ##contig header lines in the order they were first seen. """
+        return list(self.contigs.values())
+
+    def sorted_header_objects(self):
+        """ Returns all merged header lines sorted by tag. Within the tag, lines are sorted alphabetically and
+            ##contig lines with ID follow in the order they were first seen. """
+        keyed_header_objects = [((header_object.tag, 0, header_object.line), header_object) for header_object in
+                                list(self.headers_with_ID.values()) + self.header_objects_without_ID()]
+        keyed_header_objects.extend(((header_object.tag, 1, index), header_object) for index, header_object in
+                                    enumerate(self.contigs.values()))
+        keyed_header_objects.sort(key=lambda keyed_header_object: keyed_header_object[0])
+        return [header_object for _, header_object in keyed_header_objects]
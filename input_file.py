@@ -1,9 +1,17 @@
 import gzip
+import hashlib
+import os
 import re
+import struct
+import time
+import zlib
 
+from bgzf_reader import Bgzf_reader
 from body_header_line import Body_header_line
 from body_record import Body_record
 from generic_header import Generic_header
+from tabix_index import Tabix_index
+from tabix_index_writer import Tabix_index_writer
 
 
 class Input_file:
@@ -11,18 +19,32 @@ class Input_file:
         Class that represents input VCF files.
         This class contains all relevant information about input_vcf_file and methods for manipulation.
         Both, uncompressed (.vcf) and compressed (.vcf.gz) input files are supported.
+        For BGZF compressed files positions of chromosomes are BGZF virtual offsets, so reading a chromosome
+        decompresses only the blocks it spans instead of the whole file up to it.
     """
+    READ_ERRORS = (OSError, EOFError, ValueError, zlib.error)
 
-    def __init__(self, path, list_of_samples_to_be_combined):
+    def __init__(self, path, list_of_samples_to_be_combined, chromosome_positions_cache=None, file_handle_pool=None,
+                 decompression_threads=1):
         """ Create and initialize a input_file.
         :param path: path to the input_vcf_file
         :param list_of_samples_to_be_combined: samples that are of interest, ie. samples that need to be combined
+        :param chromosome_positions_cache: optional Chromosome_positions_cache used when there is no index file
+        :param file_handle_pool: optional File_handle_pool reusing handles of the input_vcf_file for reading body
+        :param decompression_threads: number of threads decompressing blocks of the BGZF input_vcf_file ahead of
+                                      reading
         """
         self.path = path
         self.path_to_idx = ""
+        self.tabix_index = None
         self.chromosomes_positions = {}
+        self.chromosomes_records_count = {}
+        self.chromosome_positions_cache = chromosome_positions_cache
+        self.file_handle_pool = file_handle_pool
+        self.decompression_threads = decompression_threads
         self.input_vcf_file = None
         self.compressed = self.path.endswith('vcf.gz') or self.path.endswith('vcf.GZ')
+        self.bgzf = self.compressed and Bgzf_reader.is_bgzf(self.path)
         self.version = None
         self.body_start_position = None
         self.body_header_line = None
@@ -33,13 +55,30 @@ class Input_file:
         self.list_of_samples_to_be_combined = list_of_samples_to_be_combined
         self.convert = lambda text: int(text) if text.isdigit() else text
         self.alphanum_key = lambda key: [self.convert(c) for c in re.split('([0-9]+)', key)]
+        self.validation_stats = None
         self.invalid = False
         self.error_message = ""
 
+    def open_compressed_file(self):
+        """ Opens compressed input_vcf_file. BGZF files are opened with Bgzf_reader, so tell() and seek() work with
+            virtual offsets. Other gzip files are opened with gzip module. """
+        if self.bgzf:
+            return Bgzf_reader(self.path, self.decompression_threads)
+        return gzip.open(self.path)
+
+    def open_body_file(self):
+        """ Returns context manager with the handle for reading body of the input_vcf_file. The handle is borrowed
+            from file_handle_pool if it is given, otherwise a new handle is opened and closed after reading. Lines are
+            read as bytes. """
+        open_file = self.open_compressed_file if self.compressed else lambda: open(self.path, 'rb')
+        if self.file_handle_pool is not None:
+            return self.file_handle_pool.handle(self.path, open_file)
+        return open_file()
+
     def read_header_of_file(self):
         """ Opens and reads a input_vcf_file regarding type of the input_vcf_file (compressed or uncompressed). """
         if self.compressed:
-            with gzip.open(self.path) as self.input_vcf_file:
+            with self.open_compressed_file() as self.input_vcf_file:
                 line_of_file = (str(self.input_vcf_file.readline(), 'utf-8'))
                 if line_of_file.startswith('##fileformat'):
                     self.version = line_of_file
@@ -91,6 +130,16 @@ class Input_file:
 
         self.input_vcf_file.seek(previous_position_of_file)
 
+    def header_hash(self):
+        """ Returns hash of all header lines, used to detect changes of the input_vcf_file. """
+        header_hash = hashlib.sha1(str(self.version).encode('utf-8'))
+        for header_object in self.list_of_header_objects + self.list_of_header_objects_without_ID + \
+                self.list_of_contigs:
+            header_hash.update(header_object.line.encode('utf-8'))
+        if self.body_header_line is not None:
+            header_hash.update('\t'.join(self.body_header_line.samples_names).encode('utf-8'))
+        return header_hash.hexdigest()
+
     def process_header_line(self, line_of_file):
         """ Creates object of type of Generic_header and places it in appropriate list, regarding the tag.
         :param line_of_file: line that will be processed
@@ -103,37 +152,105 @@ class Input_file:
         else:
             self.list_of_contigs.append(generic_header_object)
 
-    def read_specific_chrom_body_of_file(self, chrom):
+    def read_specific_chrom_body_of_file(self, chrom, regions=None):
         """ Reads all body lines in compressed or uncompressed input_vcf_file and creates appropriate Body_record object.
             Object is placed in the list list_of_body_records_chrom.
+        :param regions: optional Regions, only records overlapping them are read
         """
-        self.list_of_body_records_chrom = []
         try:
-            if chrom in self.chromosomes_positions.keys():
-                if self.compressed:
-                    with gzip.open(self.path) as self.input_vcf_file:
-                        for position in self.chromosomes_positions[chrom]:
-                            self.input_vcf_file.seek(int(position))
-                            for line in self.input_vcf_file:
-                                if line.startswith(f'{chrom}\t'.encode('utf-8')):
-                                    self.list_of_body_records_chrom.append(
-                                        Body_record(str(line, 'utf-8'), self.body_header_line))
-                                else:
-                                    break
-                    self.verify_body_records()
-                else:
-                    with open(self.path) as self.input_vcf_file:
-                        for position in self.chromosomes_positions[chrom]:
-                            self.input_vcf_file.seek(int(position))
-                            for line in self.input_vcf_file:
-                                if line.startswith(f'{chrom}\t'):
-                                    self.list_of_body_records_chrom.append(Body_record(line, self.body_header_line))
-                                else:
-                                    break
-                    self.verify_body_records()
-
-        finally:
-            pass
+            self.list_of_body_records_chrom = list(self.iterate_specific_chrom_body_of_file(chrom, regions))
+        except self.READ_ERRORS as error:
+            self.list_of_body_records_chrom = list()
+            self.set_invalid_body(error)
+            return
+        self.verify_body_records()
+
+    def iterate_specific_chrom_body_of_file(self, chrom, regions=None):
+        """ Lazily yields Body_record objects for body lines of the specific chromosome in compressed or uncompressed
+            input_vcf_file, in the order they appear in the file.
+        :param regions: optional Regions, only records overlapping them are yielded
+        """
+        if chrom not in self.chromosomes_positions.keys():
+            return
+        if regions is None:
+            yield from self.iterate_all_records_of_chrom(chrom)
+            return
+
+        if self.tabix_index is not None:
+            body_records = self.iterate_records_in_chunks(self.tabix_index.chunks_of_regions(
+                chrom, regions.intervals.get(chrom, [])))
+        else:
+            body_records = self.iterate_all_records_of_chrom(chrom)
+        for body_record in body_records:
+            if body_record.chrom == chrom and regions.overlaps(chrom, *Tabix_index_writer.interval_of_vcf_record(
+                    body_record.pos, body_record.ref, body_record.info)):
+                yield body_record
+
+    def iterate_records_in_chunks(self, chunks):
+        """ Yields Body_record objects stored in the chunks of virtual offsets of the BGZF input_vcf_file. """
+        with self.open_body_file() as input_vcf_file:
+            for start, end in chunks:
+                input_vcf_file.seek(start)
+                while input_vcf_file.tell() < end:
+                    line = input_vcf_file.readline()
+                    if not line:
+                        break
+                    yield Body_record(line, self.body_header_line)
+
+    def iterate_all_records_of_chrom(self, chrom):
+        """ Yields Body_record objects for all body lines of the specific chromosome. """
+        chrom_prefix = f'{chrom}\t'.encode('utf-8')
+        with self.open_body_file() as input_vcf_file:
+            for position in self.chromosomes_positions[chrom]:
+                input_vcf_file.seek(int(position))
+                if self.bgzf:
+                    for line in input_vcf_file.iterate_lines_with_prefix(chrom_prefix):
+                        yield Body_record(line, self.body_header_line)
+                    continue
+                for line in input_vcf_file:
+                    if line.startswith(chrom_prefix):
+                        yield Body_record(line, self.body_header_line)
+                    else:
+                        break
+
+    def iterate_sorted_specific_chrom_body_of_file(self, chrom, regions=None):
+        """ Yields Body_record objects of the specific chromosome and verifies on the fly that records are sorted by
+            position and have different ref and alt field. On the first violation, invalid record or error of reading
+            invalid is set to True, appropriate error message is set and iteration stops.
+        """
+        previous_position = 0
+        try:
+            for body_record in self.iterate_specific_chrom_body_of_file(chrom, regions):
+                position = body_record.sort_key
+                if position < previous_position:
+                    self.invalid = True
+                    self.error_message = f'Records of chromosome {chrom} are not sorted by position in ' \
+                                         f'input_vcf_file: {self.path}'
+                    return
+                if body_record.ref == body_record.alt:
+                    self.invalid = True
+                    self.error_message = f'At least of of the records have same REF and ALT field.'
+                    return
+                previous_position = position
+                yield body_record
+        except self.READ_ERRORS as error:
+            self.set_invalid_body(error)
+
+    def set_invalid_body(self, error):
+        """ Sets invalid to True and error message for the body that can't be read or parsed.
+        :param error: one of READ_ERRORS raised while reading the body, e.g. by Body_record for invalid POS or by
+                      decompression of truncated or corrupt input_vcf_file
+        """
+        self.invalid = True
+        self.error_message = f'Invalid body in input_vcf_file: {self.path}, {error}.'
+
+    def compute_columns_of_samples_to_be_combined(self, list_of_samples_to_be_combined):
+        """ Computes once which fields of body lines hold the samples to be combined, so body records only pick
+            those fields instead of mapping all samples of the line.
+        :param list_of_samples_to_be_combined: final list of samples in the order of the output file
+        """
+        self.list_of_samples_to_be_combined = list_of_samples_to_be_combined
+        self.body_header_line.set_columns_of_samples_to_be_combined(list_of_samples_to_be_combined)
 
     def verify_start_of_header_for_body(self):
         """ Verifies start of header for body. Header must start with #CHROM. If it doesn't invalid is set to True
@@ -153,47 +270,101 @@ class Input_file:
             self.invalid = True
             self.error_message = f'There is no second header line specifying data in the body in input_vcf_file: {self.path}'
 
+    def find_index_file(self):
+        """ Looks for a tabix (.tbi) or CSI (.csi) index next to the BGZF compressed input_vcf_file. Index older than
+            the input_vcf_file is ignored. Sets path_to_idx and returns True if the usable index is found. """
+        if not self.bgzf:
+            return False
+        for extension in ('.tbi', '.csi'):
+            path_to_idx = self.path + extension
+            if os.path.isfile(path_to_idx) and os.path.getmtime(path_to_idx) >= os.path.getmtime(self.path):
+                self.path_to_idx = path_to_idx
+                return True
+        return False
+
+    def read_indices_from_index_file(self):
+        """ Fills chromosomes_positions from the tabix or CSI index. Returns False if the index can't be read. """
+        try:
+            tabix_index = Tabix_index(self.path_to_idx, [contig.ID for contig in self.list_of_contigs])
+        except (OSError, ValueError, EOFError, struct.error):
+            return False
+        self.tabix_index = tabix_index
+        self.chromosomes_positions = tabix_index.chromosomes_positions()
+        return True
+
     def extract_indices_for_chromosomes(self):
-        if self.compressed:
-            with gzip.open(self.path) as self.input_vcf_file:
-                self.input_vcf_file.seek(self.body_start_position)
-                line_of_file = str(self.input_vcf_file.readline(), 'utf-8')
-
-                current_chrom = (line_of_file.split('\t'))[0]
-                if current_chrom not in self.chromosomes_positions.keys():
-                    self.chromosomes_positions[current_chrom] = list()
-                self.chromosomes_positions[current_chrom].append(self.body_start_position)
-
-                while line_of_file != '':
-                    if line_of_file.startswith(f'{current_chrom}\t'):
-                        pass
-                    else:
-                        current_chrom = (line_of_file.split('\t'))[0]
-                        if current_chrom not in self.chromosomes_positions.keys():
-                            self.chromosomes_positions[current_chrom] = list()
-                        self.chromosomes_positions[current_chrom].append(previous_position_of_file)
-                    previous_position_of_file = self.input_vcf_file.tell()
-                    line_of_file = str(self.input_vcf_file.readline(), 'utf-8')
-        else:
-            with open(self.path) as self.input_vcf_file:
-                self.input_vcf_file.seek(self.body_start_position)
+        """ Finds positions where every chromosome starts in the input_vcf_file. Positions are read from the tabix
+            or CSI index when it exists, otherwise the whole body of the input_vcf_file is scanned. If the body can't
+            be read invalid is set to True and appropriate error message is set. """
+        if self.find_index_file() and self.read_indices_from_index_file():
+            return
+
+        if self.chromosome_positions_cache is not None and self.chromosome_positions_cache.load(self):
+            return
+
+        try:
+            self.scan_indices_for_chromosomes()
+        except self.READ_ERRORS as error:
+            self.chromosomes_positions = {}
+            self.chromosomes_records_count = {}
+            self.set_invalid_body(error)
+            return
+        if self.chromosome_positions_cache is not None:
+            self.chromosome_positions_cache.store(self)
+
+    def scan_indices_for_chromosomes(self):
+        """ Reads the whole body of the input_vcf_file and records position where every chromosome starts and the
+            number of records for every chromosome. Lines are compared as bytes with the prefix of the current
+            chromosome, only names of chromosomes are decoded where a new chromosome starts. Lines of BGZF files are
+            skipped block by block while they belong to the current chromosome. Uncompressed
+            input_vcf_file is read in binary mode, so positions are byte offsets. """
+        self.chromosomes_positions = {}
+        self.chromosomes_records_count = {}
+        open_file = self.open_compressed_file if self.compressed else lambda: open(self.path, 'rb')
+        with open_file() as self.input_vcf_file:
+            self.input_vcf_file.seek(self.body_start_position)
+            position_of_line = self.body_start_position
+            current_chrom = None
+            chrom_prefix = None
+            records_count = 0
+            line_of_file = self.input_vcf_file.readline()
+            while line_of_file:
+                if chrom_prefix is None or not line_of_file.startswith(chrom_prefix):
+                    if current_chrom is not None:
+                        self.chromosomes_records_count[current_chrom] = \
+                            self.chromosomes_records_count.get(current_chrom, 0) + records_count
+                    chrom_name, separator, _ = line_of_file.partition(b'\t')
+                    current_chrom = str(chrom_name, 'utf-8')
+                    chrom_prefix = chrom_name + separator if separator else None
+                    records_count = 0
+                    self.chromosomes_positions.setdefault(current_chrom, []).append(position_of_line)
+                records_count += 1
+                if self.bgzf and chrom_prefix is not None:
+                    records_count += sum(1 for _ in self.input_vcf_file.iterate_lines_with_prefix(chrom_prefix))
+                position_of_line = self.input_vcf_file.tell()
                 line_of_file = self.input_vcf_file.readline()
+            if current_chrom is not None:
+                self.chromosomes_records_count[current_chrom] = \
+                    self.chromosomes_records_count.get(current_chrom, 0) + records_count
 
-                current_chrom = (line_of_file.split('\t'))[0]
-                if current_chrom not in self.chromosomes_positions.keys():
-                    self.chromosomes_positions[current_chrom] = list()
-                self.chromosomes_positions[current_chrom].append(self.body_start_position)
+    def estimate_chromosome_sizes(self):
+        """ Estimates size of every chromosome in bytes from distances between positions where chromosomes start.
+            For BGZF files compressed bytes are used. Size of the last chromosome in other gzip files is unknown
+            and is estimated as 0. """
+        if self.bgzf:
+            starts = sorted((position >> 16, chrom) for chrom, positions in self.chromosomes_positions.items()
+                            for position in positions)
+            end_of_file = os.path.getsize(self.path)
+        else:
+            starts = sorted((int(position), chrom) for chrom, positions in self.chromosomes_positions.items()
+                            for position in positions)
+            end_of_file = None if self.compressed else os.path.getsize(self.path)
 
-                while line_of_file != '':
-                    if line_of_file.startswith(f'{current_chrom}\t'):
-                        pass
-                    else:
-                        current_chrom = (line_of_file.split('\t'))[0]
-                        if current_chrom not in self.chromosomes_positions.keys():
-                            self.chromosomes_positions[current_chrom] = list()
-                        self.chromosomes_positions[current_chrom].append(previous_position_of_file)
-                    previous_position_of_file = self.input_vcf_file.tell()
-                    line_of_file = self.input_vcf_file.readline()
+        chromosome_sizes = {}
+        for index, (start, chrom) in enumerate(starts):
+            end = starts[index + 1][0] if index + 1 < len(starts) else end_of_file
+            chromosome_sizes[chrom] = chromosome_sizes.get(chrom, 0) + (end - start if end is not None else 0)
+        return chromosome_sizes
 
     def verify_body_records(self):
         """ Verifies if all body records have different ref and alt field. If there is record that has same
@@ -201,3 +372,58 @@ class Input_file:
         if sum(body_record.ref == body_record.alt for body_record in self.list_of_body_records_chrom) > 0:
             self.invalid = True
             self.error_message = f'At least of of the records have same REF and ALT field.'
+
+    def validate_body(self):
+        """ Streams the whole body of the input_vcf_file with minimal parsing and checks that every record has at
+            least eight fields and as many sample fields as the body header line, that POS is a number, REF and ALT
+            are different, records of every chromosome are contiguous and sorted by position. On the first violation
+            or if the body can't be read (e.g. truncated or corrupt compressed file) invalid is set to True and
+            appropriate error message with the line number is set. Sets validation_stats with numbers of records and
+            chromosomes and seconds spent. The header has to be read first. """
+        start = time.perf_counter()
+        number_of_samples = len(self.body_header_line.samples_names)
+        seen_chromosomes = set()
+        current_chrom = None
+        previous_position = 0
+        number_of_records = 0
+        open_file = self.open_compressed_file if self.compressed else lambda: open(self.path, 'rb')
+        try:
+            with open_file() as input_vcf_file:
+                input_vcf_file.seek(self.body_start_position)
+                lines = input_vcf_file.iterate_lines_with_prefix(b'') if self.bgzf else input_vcf_file
+                for line_number, line in enumerate(lines, 1):
+                    error_message = None
+                    fields = line.rstrip(b'\r\n').split(b'\t', 8)
+                    number_of_sample_fields = fields[8].count(b'\t') if len(fields) == 9 else number_of_samples
+                    if len(fields) < 8:
+                        error_message = 'record has less than 8 fields'
+                    elif number_of_sample_fields != number_of_samples:
+                        error_message = f'record has {number_of_sample_fields} sample fields, but the body header ' \
+                                        f'line has {number_of_samples} samples'
+                    elif not fields[1].isdigit():
+                        error_message = f'POS {str(fields[1], "utf-8")} is not a number'
+                    elif fields[3] == fields[4]:
+                        error_message = 'record has same REF and ALT field'
+                    else:
+                        position = int(fields[1])
+                        if fields[0] != current_chrom:
+                            if fields[0] in seen_chromosomes:
+                                error_message = f'records of chromosome {str(fields[0], "utf-8")} are not contiguous'
+                            current_chrom = fields[0]
+                            seen_chromosomes.add(current_chrom)
+                        elif position < previous_position:
+                            error_message = f'records of chromosome {str(fields[0], "utf-8")} are not sorted by ' \
+                                            f'position'
+                        previous_position = position
+                    if error_message is not None:
+                        self.invalid = True
+                        self.error_message = f'Invalid body line {line_number} in input_vcf_file: {self.path}, ' \
+                                             f'{error_message}.'
+                        break
+                    number_of_records += 1
+        except self.READ_ERRORS as error:
+            self.invalid = True
+            self.error_message = f'Invalid body line {number_of_records + 1} in input_vcf_file: {self.path}, ' \
+                                 f'file can\'t be read: {error}.'
+        self.validation_stats = {'records': number_of_records, 'chromosomes': len(seen_chromosomes),
+                                 'seconds': time.perf_counter() - start}
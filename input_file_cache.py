@@ -0,0 +1,66 @@
+import copy
+import os
+
+
+class Input_file_cache:
+    """ In-memory cache of parsed headers and positions of chromosomes of input files, shared by all jobs of one
+        batch run, so an input file used by more jobs is read and indexed only once. Entry is valid only while size
+        and modification time of the input file are unchanged. Header objects are shared between jobs, the body
+        header line is copied for every job, because columns of samples to be combined are computed on it.
+    """
+
+    def __init__(self):
+        """ Create and initialize an empty Input_file_cache. """
+        self.headers = {}
+        self.positions = {}
+
+    @staticmethod
+    def file_signature(path):
+        """ Returns values that have to match for the cache entry of the file to be valid. """
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def load_header(self, input_file):
+        """ Fills header of input_file from the cache. Returns False if there is no valid entry for input_file. """
+        entry = self.headers.get(self.file_signature(input_file.path))
+        if entry is None:
+            return False
+        input_file.version = entry['version']
+        input_file.list_of_header_objects = list(entry['list_of_header_objects'])
+        input_file.list_of_header_objects_without_ID = list(entry['list_of_header_objects_without_ID'])
+        input_file.list_of_contigs = list(entry['list_of_contigs'])
+        input_file.body_start_position = entry['body_start_position']
+        input_file.body_header_line = copy.copy(entry['body_header_line'])
+        return True
+
+    def store_header(self, input_file):
+        """ Stores header of input_file whose header has been read and is valid. """
+        if input_file.invalid is True:
+            return
+        self.headers[self.file_signature(input_file.path)] = {
+            'version': input_file.version,
+            'list_of_header_objects': list(input_file.list_of_header_objects),
+            'list_of_header_objects_without_ID': list(input_file.list_of_header_objects_without_ID),
+            'list_of_contigs': list(input_file.list_of_contigs),
+            'body_start_position': input_file.body_start_position,
+            'body_header_line': copy.copy(input_file.body_header_line)}
+
+    def load_positions(self, input_file):
+        """ Fills positions of chromosomes and the index of input_file from the cache. Returns False if there is no
+            valid entry for input_file. """
+        entry = self.positions.get(self.file_signature(input_file.path))
+        if entry is None:
+            return False
+        input_file.chromosomes_positions = dict(entry['chromosomes_positions'])
+        input_file.chromosomes_records_count = dict(entry['chromosomes_records_count'])
+        input_file.path_to_idx = entry['path_to_idx']
+        input_file.tabix_index = entry['tabix_index']
+        return True
+
+    def store_positions(self, input_file):
+        """ Stores positions of chromosomes and the index of input_file. """
+        self.positions[self.file_signature(input_file.path)] = {
+            'chromosomes_positions': dict(input_file.chromosomes_positions),
+            'chromosomes_records_count': dict(input_file.chromosomes_records_count),
+            'path_to_idx': input_file.path_to_idx,
+            'tabix_index': input_file.tabix_index}
@@ -0,0 +1,132 @@
+import os
+import time
+
+from collections import Counter
+from input_file import Input_file
+from input_file_cache import Input_file_cache
+from output_file import Output_file
+
+manifest_in_worker = None
+
+
+def run_job_in_worker(index):
+    """ Runs one job of manifest_in_worker in a worker process and returns its result. """
+    return manifest_in_worker.run_job(manifest_in_worker.jobs[index])
+
+
+class Manifest:
+    """ Batch of independent combining jobs read from a tab separated manifest file. Every line is one job with the
+        output file, comma separated input files and optionally comma separated samples, empty lines and lines
+        starting with # are skipped. Other options of the command line apply to all jobs.
+        Jobs run one after another in this process, or in a pool of worker processes with --processes. Headers and
+        positions of chromosomes of input files are kept in Input_file_cache, so an input file used by more jobs is
+        read and indexed only once. With worker processes, input files used by more jobs are read before the workers
+        are forked, so all workers share them.
+    """
+
+    def __init__(self, arguments):
+        """ Create and initialize a Manifest and read jobs from the manifest file.
+        :param arguments: dictionary of arguments as parsed by docopt
+        """
+        self.arguments = arguments
+        self.path = arguments['--manifest']
+        self.processes = int(arguments.get('--processes') or 1)
+        self.jobs = []
+        self.results = []
+        self.seconds = 0.0
+        self.input_file_cache = Input_file_cache()
+        self.invalid = None
+        self.error_message = None
+        self.read()
+
+    def read(self):
+        """ Reads jobs from the manifest file. If the file can't be read or some line is invalid, invalid is set to
+            True and appropriate error message is set. """
+        try:
+            with open(self.path) as manifest_file:
+                for line_number, line in enumerate(manifest_file, 1):
+                    line = line.rstrip('\r\n')
+                    if line.strip() == '' or line.startswith('#'):
+                        continue
+                    fields = line.split('\t')
+                    if not 2 <= len(fields) <= 3 or fields[0] == '' or fields[1] == '':
+                        self.invalid = True
+                        self.error_message = f'Invalid line {line_number} in manifest {self.path}, expected output ' \
+                                             f'file, input files and optionally samples separated by tabs.'
+                        return
+                    self.jobs.append({'out': fields[0], 'input_files': fields[1].split(','),
+                                      'samples': fields[2] if len(fields) == 3 and fields[2] != '' else None})
+        except OSError as error:
+            self.invalid = True
+            self.error_message = f'Manifest {self.path} can\'t be read: {error}'
+            return
+        if len(self.jobs) == 0:
+            self.invalid = True
+            self.error_message = f'There are no jobs in manifest {self.path}.'
+
+    def job_arguments(self, job):
+        """ Returns arguments of Output_file for the job. Jobs are not split into processes and don't write metrics
+            on their own. """
+        arguments = dict(self.arguments)
+        arguments.update({'--input_file': list(job['input_files']), '--out': job['out'],
+                          '--sample_name': job['samples'], '--manifest': None, '--processes': None,
+                          '--metrics': None, '--profile': None})
+        return arguments
+
+    def run_job(self, job):
+        """ Combines input files of the job and returns its result: output file, error message which is None if the
+            job succeeded and seconds spent. """
+        start = time.perf_counter()
+        output_file = Output_file(self.job_arguments(job), input_file_cache=self.input_file_cache)
+        try:
+            if output_file.invalid is not True:
+                output_file.process_input_files()
+            error_message = output_file.error_message if output_file.invalid is True else None
+        except Exception as error:
+            error_message = f'{type(error).__name__}: {error}'
+        return {'out': output_file.path or job['out'], 'error_message': error_message,
+                'seconds': time.perf_counter() - start}
+
+    def warm_input_file_cache(self):
+        """ Reads headers and positions of chromosomes of input files used by more than one job into the input file
+            cache. """
+        usages = Counter(os.path.abspath(path) for job in self.jobs for path in set(job['input_files']))
+        for path, count in usages.items():
+            if count < 2 or not os.path.isfile(path):
+                continue
+            input_file = Input_file(path, [])
+            input_file.read_header_of_file()
+            if input_file.invalid is True:
+                continue
+            self.input_file_cache.store_header(input_file)
+            input_file.extract_indices_for_chromosomes()
+            self.input_file_cache.store_positions(input_file)
+
+    def run(self):
+        """ Runs all jobs and returns False if some job failed. """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        global manifest_in_worker
+        start = time.perf_counter()
+        processes = min(self.processes, len(self.jobs))
+        if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            self.warm_input_file_cache()
+            manifest_in_worker = self
+            with ProcessPoolExecutor(max_workers=processes,
+                                     mp_context=multiprocessing.get_context('fork')) as executor:
+                self.results = list(executor.map(run_job_in_worker, range(len(self.jobs))))
+            manifest_in_worker = None
+        else:
+            self.results = [self.run_job(job) for job in self.jobs]
+        self.seconds = time.perf_counter() - start
+        return all(result['error_message'] is None for result in self.results)
+
+    def summary(self):
+        """ Returns text with result and seconds of every job, followed by numbers of all and failed jobs and seconds
+            of the whole batch. """
+        lines = [f'{result["out"]}: {result["seconds"]:.2f} s, {result["error_message"] or "OK"}\n'
+                 for result in self.results]
+        failed = sum(result['error_message'] is not None for result in self.results)
+        lines.append(f'{len(self.results)} jobs, {failed} failed, {self.seconds:.2f} s\n')
+        return ''.join(lines)
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Metrics:
+    """ Collects metrics of one run: wall and CPU time of stages, counters of records and bytes and peak RSS, in total,
+        per chromosome and per input file. CPU time is measured per thread, so stages running in parallel threads
+        are measured separately. Optionally every chromosome is profiled with cProfile and the profile of the
+        chromosome that took the longest is kept. When metrics are disabled all methods return immediately.
+    """
+
+    def __init__(self, enabled=False, profile=False):
+        """ Create and initialize Metrics.
+        :param enabled: True if metrics are collected
+        :param profile: True if chromosomes are profiled with cProfile
+        """
+        self.enabled = enabled
+        self.profile = enabled and profile
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages = {}
+        self.counters = {}
+        self.chromosomes = {}
+        self.lock = threading.Lock()
+        self.hottest_chromosome = None
+        self.hottest_chromosome_wall = 0.0
+        self.hottest_chromosome_profile = None
+
+    @staticmethod
+    def peak_rss_kb():
+        """ Peak resident set size of this process in kB, None if it can't be measured. """
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def metrics_of_chromosome(self, chrom):
+        """ Returns dictionary with metrics of the chromosome, it is created on the first access. """
+        if chrom not in self.chromosomes:
+            self.chromosomes[chrom] = {'stages': {}, 'counters': {}, 'inputs': {}, 'peak_rss_kb': None}
+        return self.chromosomes[chrom]
+
+    def targets(self, chrom, input_path):
+        """ Returns dictionaries of metrics that a measurement of the chromosome and input file is added to. """
+        targets = [{'stages': self.stages, 'counters': self.counters}]
+        if chrom is not None:
+            metrics_of_chromosome = self.metrics_of_chromosome(chrom)
+            targets.append(metrics_of_chromosome)
+            if input_path is not None:
+                targets.append(metrics_of_chromosome['inputs'].setdefault(input_path, {'stages': {}, 'counters': {}}))
+        return targets
+
+    def add_time(self, stage, wall, cpu, chrom=None, input_path=None):
+        """ Adds wall and CPU time of one call of the stage. """
+        if not self.enabled:
+            return
+        with self.lock:
+            for target in self.targets(chrom, input_path):
+                stage_metrics = target['stages'].setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+                stage_metrics['wall'] += wall
+                stage_metrics['cpu'] += cpu
+                stage_metrics['calls'] += 1
+
+    def count(self, counter, value, chrom=None, input_path=None):
+        """ Adds value to the counter. """
+        if not self.enabled:
+            return
+        with self.lock:
+            for target in self.targets(chrom, input_path):
+                target['counters'][counter] = target['counters'].get(counter, 0) + value
+
+    @contextmanager
+    def stage(self, stage, chrom=None, input_path=None):
+        """ Context manager measuring the stage. """
+        if not self.enabled:
+            yield
+            return
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start_wall, time.thread_time() - start_cpu, chrom, input_path)
+
+    def timed_iterator(self, iterable, stage, chrom=None):
+        """ Returns iterator over iterable that adds time spent in producing items to the stage. """
+        if not self.enabled:
+            return iterable
+        return self.iterate_timed(iterable, stage, chrom)
+
+    def iterate_timed(self, iterable, stage, chrom):
+        """ Yields items of iterable and measures time spent in next() calls. The time is added when iteration
+            ends. """
+        iterator = iter(iterable)
+        wall, cpu = 0.0, 0.0
+        try:
+            while True:
+                start_wall, start_cpu = time.perf_counter(), time.thread_time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    wall += time.perf_counter() - start_wall
+                    cpu += time.thread_time() - start_cpu
+                yield item
+        finally:
+            self.add_time(stage, wall, cpu, chrom)
+
+    @contextmanager
+    def chromosome(self, chrom):
+        """ Context manager around processing of the whole chromosome. Records its wall time and peak RSS and
+            profiles it if profiling is enabled. """
+        if not self.enabled:
+            yield
+            return
+        profiler = None
+        if self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        start_wall = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall = time.perf_counter() - start_wall
+            with self.lock:
+                metrics_of_chromosome = self.metrics_of_chromosome(chrom)
+                metrics_of_chromosome['wall'] = metrics_of_chromosome.get('wall', 0.0) + wall
+                metrics_of_chromosome['peak_rss_kb'] = self.peak_rss_kb()
+            if profiler is not None and wall > self.hottest_chromosome_wall:
+                self.hottest_chromosome, self.hottest_chromosome_wall = chrom, wall
+                self.hottest_chromosome_profile = profiler
+
+    def add_metrics_of_chromosome(self, chrom, metrics_of_chromosome):
+        """ Adds metrics of the chromosome measured in another process, e.g. a worker merging the chromosome. """
+        if not self.enabled or metrics_of_chromosome is None:
+            return
+        with self.lock:
+            self.chromosomes[chrom] = metrics_of_chromosome
+            for stage, stage_metrics in metrics_of_chromosome['stages'].items():
+                total_stage_metrics = self.stages.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+                for key, value in stage_metrics.items():
+                    total_stage_metrics[key] += value
+            for counter, value in metrics_of_chromosome['counters'].items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def write(self, path, path_of_profile=None):
+        """ Writes metrics in the JSON file if path is given and the profile of the hottest chromosome in
+            path_of_profile if it is given. """
+        if not self.enabled:
+            return
+        metrics = {'wall': time.perf_counter() - self.start_wall, 'cpu': time.process_time() - self.start_cpu,
+                   'peak_rss_kb': self.peak_rss_kb(), 'stages': self.stages, 'counters': self.counters,
+                   'chromosomes': self.chromosomes}
+        if resource is not None:
+            metrics['peak_rss_kb_of_child_processes'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if path_of_profile and self.hottest_chromosome_profile is not None:
+            self.hottest_chromosome_profile.dump_stats(path_of_profile)
+            metrics['profiled_chromosome'] = self.hottest_chromosome
+        if path:
+            with open(path, 'w') as metrics_file:
+                json.dump(metrics, metrics_file, indent=2)
@@ -1,25 +1,102 @@
+import heapq
+import itertools
 import os
 import re
-import toolz
-import bgzip
+import sys
 
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from bgzf_writer import Bgzf_writer
 from body_header_line import Body_header_line
 from body_record import Body_record
+from chromosome_positions_cache import Chromosome_positions_cache
+from file_handle_pool import File_handle_pool
+from header_registry import Header_registry
 from input_file import Input_file
+from metrics import Metrics
+from regions import Regions
+from scatter_plan import Scatter_plan
+from tabix_index_writer import Tabix_index_writer
+
+output_file_in_worker = None
+
+
+def merge_specific_chrom_in_worker(chrom):
+    """ Merges one chromosome of output_file_in_worker in a worker process. Returns merged chromosome as bytes, or as
+        BGZF blocks for compressed output file, error message if some input file is invalid, entries for the
+        index of the output file if it is written and metrics of the chromosome if they are collected. """
+    output_file = output_file_in_worker
+    metrics = output_file.metrics
+    metrics.profile = False
+    with metrics.chromosome(chrom):
+        if output_file.streaming:
+            list_of_body_records = list(metrics.timed_iterator(
+                output_file.stream_merged_body_records_of_specific_chrom(chrom), 'read_and_merge', chrom))
+        else:
+            output_file.read_and_merge_specific_chrom(chrom)
+            list_of_body_records = output_file.list_of_body_records_chrom
+
+        error_files = [input_file for input_file in output_file.list_of_input_files if input_file.invalid is True]
+        if len(error_files) > 0:
+            return None, error_files[0].error_message, None, None
+
+        with metrics.stage('write', chrom):
+            index_entries = None
+            if output_file.tabix_index_writer is not None:
+                index_entries = output_file.index_entries_of_body_records(list_of_body_records)
+            chunk = b''.join(body_record.line for body_record in list_of_body_records)
+            metrics.count('records_written', len(list_of_body_records), chrom)
+            metrics.count('bytes_written', len(chunk), chrom)
+            if output_file.compressed:
+                chunk = Bgzf_writer.compress_to_blocks(chunk)
+    return chunk, None, index_entries, metrics.chromosomes.pop(chrom, None)
+
+
+def validate_input_file_in_worker(index):
+    """ Validates body of one input file of output_file_in_worker in a worker process. Returns validation stats and
+        error message, which is None if the input file is valid. """
+    input_file = output_file_in_worker.list_of_input_files[index]
+    input_file.validate_body()
+    return input_file.validation_stats, input_file.error_message if input_file.invalid is True else None
 
 
 class Output_file:
     """ Represents the output file that will be generated by combining and merging all input files. """
-
-    def __init__(self, arguments):
+    STREAMING_BATCH_SIZE = 10000
+    READING_THREADS = 10
+    OUTPUT_BUFFER_SIZE = 1024 * 1024
+    DIGITS = re.compile(b'([0-9]+)')
+
+    def __init__(self, arguments, sink=None, input_file_cache=None):
+        """ Create and initialize an Output_file.
+        :param arguments: dictionary of arguments as parsed by docopt
+        :param sink: optional binary file object the output is written to instead of the output path. It is flushed,
+                     but not closed at the end.
+        :param input_file_cache: optional Input_file_cache with headers and positions of chromosomes of input files
+                                 shared with other jobs of the batch
+        """
         self.path = None
+        self.sink = sink
         self.file = None
         self.compressed = None
         self.version = None
         self.keep_variants_different_format = False
+        self.path_to_reference_index = None
+        self.regions = None
+        self.scatter_plan = None
+        self.shard = None
+        self.path_to_plan = None
+        self.number_of_shards = None
+        self.streaming = False
+        self.processes = 1
+        self.threads = 1
+        self.decompression_threads = 1
+        self.write_index = False
+        self.tabix_index_writer = None
         self.chromosomes_position = {}
         self.body_header_line = None
+        self.header_registry = Header_registry()
+        self.header_only = False
+        self.validate_only = False
         self.list_of_header_objects = list()
         self.list_of_header_objects_without_ID = list()
         self.list_of_body_records_chrom = list()
@@ -27,6 +104,13 @@ class Output_file:
         self.list_of_input_files_paths = list()
         self.list_of_input_files = list()
         self.list_of_samples_to_be_combined = list()
+        self.chromosome_positions_cache = None
+        self.input_file_cache = input_file_cache
+        self.max_open_files = File_handle_pool.DEFAULT_MAX_OPEN_FILES
+        self.file_handle_pool = None
+        self.metrics = Metrics()
+        self.path_to_metrics = None
+        self.path_to_profile = None
         self.arguments = arguments
         self.error_message = None
         self.invalid = None
@@ -42,19 +126,91 @@ class Output_file:
             for sample_name in self.arguments['--sample_name']:
                 self.list_of_samples_to_be_combined.append(sample_name)
 
+        if self.arguments.get('scatter'):
+            if not self.arguments.get('--shards') or not self.arguments['--out']:
+                self.invalid = True
+                self.error_message = 'Scatter requires number of shards (--shards) and the plan file (-o).'
+                return
+            self.path_to_plan = self.arguments['--out']
+            self.number_of_shards = int(self.arguments['--shards'])
+            self.arguments['--out'] = None
+            if self.number_of_shards < 1:
+                self.invalid = True
+                self.error_message = 'Number of shards must be at least 1.'
+                return
+
+        if self.arguments.get('--plan'):
+            self.scatter_plan = Scatter_plan()
+            self.scatter_plan.read(self.arguments['--plan'])
+            if self.scatter_plan.invalid is True:
+                self.invalid = True
+                self.error_message = self.scatter_plan.error_message
+                return
+            self.shard = int(self.arguments['--shard'])
+            if not 0 <= self.shard < len(self.scatter_plan.shards):
+                self.invalid = True
+                self.error_message = f'Shard {self.shard} is not in the scatter plan {self.arguments["--plan"]}.'
+                return
+            if len(self.arguments['--input_file']) == 0:
+                self.arguments['--input_file'] = self.scatter_plan.list_of_input_files_paths
+            if len(self.list_of_samples_to_be_combined) == 0:
+                self.list_of_samples_to_be_combined.extend(self.scatter_plan.list_of_samples)
+
         if self.arguments['--out']:
             self.path = self.arguments['--out']
 
+        if self.arguments.get('--reference_index'):
+            if not os.path.isfile(self.arguments['--reference_index']):
+                self.invalid = True
+                self.error_message = f'No such file {self.arguments["--reference_index"]}.'
+                return
+            self.path_to_reference_index = self.arguments['--reference_index']
+
+        if self.arguments.get('--regions') or self.arguments.get('--regions_file'):
+            self.regions = Regions()
+            try:
+                if self.arguments.get('--regions'):
+                    for region in self.arguments['--regions'].split(','):
+                        self.regions.add_region_string(region)
+                if self.arguments.get('--regions_file'):
+                    self.regions.read_bed_file(self.arguments['--regions_file'])
+            except (OSError, ValueError) as error:
+                self.invalid = True
+                self.error_message = f'Invalid regions: {error}'
+                return
+            self.regions.merge_intervals()
+
+        if self.arguments.get('--cache_dir'):
+            self.chromosome_positions_cache = Chromosome_positions_cache(self.arguments['--cache_dir'],
+                                                                         self.arguments.get('--cache_size') or 100)
+
+        if self.arguments.get('--metrics') or self.arguments.get('--profile'):
+            self.path_to_metrics = self.arguments.get('--metrics')
+            self.path_to_profile = self.arguments.get('--profile')
+            self.metrics = Metrics(True, self.path_to_profile is not None)
+
+        if self.arguments.get('--max_open_files'):
+            self.max_open_files = int(self.arguments['--max_open_files'])
+            if self.max_open_files < 2:
+                self.invalid = True
+                self.error_message = 'Maximal number of open files must be at least 2.'
+                return
+        self.file_handle_pool = File_handle_pool(self.max_open_files)
+
+        if self.arguments.get('--decompression_threads'):
+            self.decompression_threads = int(self.arguments['--decompression_threads'])
+
         for file_path in self.arguments['--input_file']:
             if not os.path.isfile(file_path):
                 self.invalid = True
                 self.error_message = f'No such file {file_path}.'
                 return
-            input_file = Input_file(file_path, self.list_of_samples_to_be_combined)
+            input_file = Input_file(file_path, self.list_of_samples_to_be_combined, self.chromosome_positions_cache,
+                                    self.file_handle_pool, self.decompression_threads)
             self.list_of_input_files.append(input_file)
             self.list_of_input_files_paths.append(file_path)
 
-        if self.arguments['--out']:
+        if self.arguments['--out'] or self.sink is not None:
             self.path = self.arguments['--out']
             if self.arguments['--output_format'] == 'COMPRESSED':
                 self.compressed = True
@@ -78,24 +234,51 @@ class Output_file:
                     self.path = self.path[:-3]
 
         if self.arguments['--keep_variants_with_different_format']:
-            print("Trueeeeueueu")
             self.keep_variants_different_format = True
 
+        if self.arguments.get('--header_only'):
+            self.header_only = True
+
+        if self.arguments.get('--validate_only'):
+            self.validate_only = True
+
+        if self.arguments.get('--streaming'):
+            self.streaming = True
+
+        if self.arguments.get('--processes'):
+            self.processes = int(self.arguments['--processes'])
+
+        if self.arguments.get('--threads'):
+            self.threads = int(self.arguments['--threads'])
+
+        if self.arguments.get('--write_index'):
+            if not (self.path and self.compressed):
+                self.invalid = True
+                self.error_message = 'Index can be written only for compressed output file.'
+                return
+            self.write_index = True
+
     def process_input_files(self):
         """ Processes input files, first it reads the header, then body part, taking into
-            consideration the validity of input files. """
-        self.read_header_in_input_files()
-        self.check_if_input_file_invalid()
-        if self.invalid is not True:
-            self.process_headers()
-            self.write_header_in_output_file()
-            self.extract_chromosomes()
-            self.check_samples_in_all_input_files()
-            if self.invalid is not True:
+            consideration the validity of input files. Body part is skipped if only the header is written. """
+        if self.prepare_input_files():
+            with self.metrics.stage('write'):
+                self.write_header_in_output_file()
+            if self.header_only:
+                self.check_if_input_file_invalid()
+            elif self.processes > 1:
+                self.process_body_in_parallel_and_write()
+            elif self.streaming:
+                self.stream_body_in_input_files_and_write()
+            else:
                 self.read_body_in_input_files_and_write()
-                if self.invalid is not True:
-                    self.check_if_input_file_invalid()
+            if self.invalid is not True:
+                self.check_if_input_file_invalid()
 
+        with self.metrics.stage('write'):
+            self.close_output_file()
+        self.file_handle_pool.close()
+        self.metrics.write(self.path_to_metrics, self.path_to_profile)
         if self.invalid is True:
             if self.path:
                 if os.path.isfile(self.path):
@@ -104,35 +287,148 @@ class Output_file:
         else:
             return True
 
+    def prepare_input_files(self):
+        """ Reads and merges headers and finds positions of chromosomes in input files. Positions of chromosomes are
+            not needed and not searched for if only the header is written. Returns False if some input file is
+            invalid. """
+        with self.metrics.stage('header_read'):
+            self.read_header_in_input_files()
+        self.check_if_input_file_invalid()
+        if self.invalid is not True:
+            with self.metrics.stage('process_headers'):
+                self.process_headers()
+            if not self.header_only:
+                with self.metrics.stage('extract_chromosomes'):
+                    self.extract_chromosomes()
+                self.check_if_input_file_invalid()
+            self.check_samples_in_all_input_files()
+        return self.invalid is not True
+
+    def iterate_merged_body_records(self):
+        """ Yields merged body records of all chromosomes in the order of the output file instead of writing them.
+            prepare_input_files must be called first. If some input file is invalid, iteration stops, invalid is set
+            to True and appropriate error message is set. """
+        if self.streaming:
+            self.prepare_samples_for_body_records()
+        for chrom in self.sorted_list_of_chromosomes():
+            if self.streaming:
+                yield from self.stream_merged_body_records_of_specific_chrom(chrom)
+                self.check_if_input_file_invalid()
+            else:
+                self.read_and_merge_specific_chrom(chrom)
+                self.check_if_input_file_invalid()
+                if self.invalid is not True:
+                    yield from self.list_of_body_records_chrom
+            if self.invalid is True:
+                return
+
+    def scatter_input_files(self):
+        """ Reads headers and positions of chromosomes in input files and writes the scatter plan with
+            number_of_shards shards balanced by estimated sizes of chromosomes. """
+        if not self.prepare_input_files():
+            return False
+
+        shards = Scatter_plan.balanced_shards(self.sorted_list_of_chromosomes(), self.estimate_chromosome_sizes(),
+                                              self.number_of_shards)
+        Scatter_plan([os.path.abspath(path) for path in self.list_of_input_files_paths],
+                     self.list_of_samples_to_be_combined, shards).write(self.path_to_plan)
+        return True
+
+    def validate_input_files(self):
+        """ Checks input files without writing the output file. Headers are read first and samples to be combined are
+            checked in all input files, then bodies of all input files are streamed in parallel processes (or in this
+            process without fork start method) and checked by Input_file.validate_body. Returns False if some input
+            file is invalid, error message is set according to the first invalid input file. """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        global output_file_in_worker
+        with self.metrics.stage('header_read'):
+            self.read_header_in_input_files()
+        self.check_if_input_file_invalid()
+        if self.invalid is True:
+            return False
+        if len(self.list_of_samples_to_be_combined) == 0:
+            self.determinate_samples_to_be_combined()
+        self.check_samples_in_all_input_files()
+        if self.invalid is True:
+            return False
+
+        with self.metrics.stage('validate'):
+            processes = min(self.processes if self.processes > 1 else os.cpu_count() or 1,
+                            len(self.list_of_input_files))
+            if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                output_file_in_worker = self
+                with ProcessPoolExecutor(max_workers=processes,
+                                         mp_context=multiprocessing.get_context('fork')) as executor:
+                    results = list(executor.map(validate_input_file_in_worker, range(len(self.list_of_input_files))))
+                output_file_in_worker = None
+                for input_file, (validation_stats, error_message) in zip(self.list_of_input_files, results):
+                    input_file.validation_stats = validation_stats
+                    if error_message is not None:
+                        input_file.invalid = True
+                        input_file.error_message = error_message
+            else:
+                for input_file in self.list_of_input_files:
+                    input_file.validate_body()
+        self.check_if_input_file_invalid()
+        return self.invalid is not True
+
+    def validation_report(self):
+        """ Returns text with result, number of records and chromosomes and seconds of validation of every input
+            file. """
+        lines = []
+        for input_file in self.list_of_input_files:
+            stats = input_file.validation_stats
+            if stats is None:
+                continue
+            result = input_file.error_message if input_file.invalid is True else 'OK'
+            lines.append(f'{input_file.path}: {stats["records"]} records, {stats["chromosomes"]} chromosomes, '
+                         f'{stats["seconds"]:.2f} s, {result}\n')
+        return ''.join(lines)
+
     def read_header_in_input_files(self):
-        """ Reads header parts of all input files and adds a list of certain objects into the appropriate lists. """
+        """ Reads header parts of all input files and adds their header lines into the header registry. Headers
+            found in the input file cache are not read again. """
         for input_file in self.list_of_input_files:
-            input_file.read_header_of_file()
-            self.list_of_header_objects.extend(input_file.list_of_header_objects)
-            self.list_of_header_objects_without_ID.extend(input_file.list_of_header_objects_without_ID)
-            self.list_of_contigs.extend(input_file.list_of_contigs)
+            if self.input_file_cache is None or not self.input_file_cache.load_header(input_file):
+                input_file.read_header_of_file()
+                if self.input_file_cache is not None:
+                    self.input_file_cache.store_header(input_file)
+            self.header_registry.add_input_file(input_file)
         self.version = self.list_of_input_files[0].version
 
+    def reading_threads(self):
+        """ Number of threads reading input files at the same time, limited by the maximal number of open files. """
+        return min(self.READING_THREADS, self.max_open_files)
+
     def extract_chromosomes(self):
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            [executor.submit(self.extract_indices_for_chrom_in_file, input_file) for input_file in
-             self.list_of_input_files]
+        """ Finds positions of chromosomes in all input files in parallel threads. Exceptions raised in the threads
+            are raised here. """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.reading_threads()) as executor:
+            futures = [executor.submit(self.extract_indices_for_chrom_in_file, input_file) for input_file in
+                       self.list_of_input_files]
+        for future in futures:
+            future.result()
 
     def extract_indices_for_chrom_in_file(self, input_file):
-        input_file.extract_indices_for_chromosomes()
+        if self.input_file_cache is None or not self.input_file_cache.load_positions(input_file):
+            input_file.extract_indices_for_chromosomes()
+            if self.input_file_cache is not None and input_file.invalid is not True:
+                self.input_file_cache.store_positions(input_file)
         self.chromosomes_position.update(input_file.chromosomes_positions)
 
     def process_headers(self):
-        """ Delete duplicates and sort all lists regarding the header. Creates a body header line according to the
-            samples. """
-        self.list_of_header_objects = list(toolz.unique(self.list_of_header_objects, key=lambda x: x.tag_and_ID))
-        self.list_of_header_objects_without_ID = list(
-            toolz.unique(self.list_of_header_objects_without_ID, key=lambda x: x.line))
-        self.list_of_contigs = list(toolz.unique(self.list_of_contigs, key=lambda x: x.line))
-        self.list_of_header_objects.extend(self.list_of_header_objects_without_ID)
-        self.list_of_header_objects.sort(key=lambda x: x.line)
-        self.list_of_header_objects.extend(self.list_of_contigs)
-        self.list_of_header_objects.sort(key=lambda x: x.tag, reverse=False)
+        """ Takes merged header lines without duplicates from the header registry, sorted by tag. Conflicting
+            definitions of the same tag and ID are printed to stderr, the first definition is used. Creates a body
+            header line according to the samples. """
+        for conflict in self.header_registry.conflicts:
+            print(f'Warning: {conflict}', file=sys.stderr)
+        self.list_of_header_objects_without_ID = self.header_registry.header_objects_without_ID()
+        self.list_of_contigs = self.header_registry.list_of_contigs()
+        self.list_of_header_objects = self.header_registry.sorted_header_objects()
         self.create_body_header_line_for_output()
 
     def read_body_in_input_files_and_write(self):
@@ -140,22 +436,228 @@ class Output_file:
             chromosome from all input files. After reading one chromosome in a file, the list containing information
             is updated. This list is then filtered to remove duplicates and sorted. Then the body records for specific
             chromosomes are written in the output file. """
-        list_of_chrom = list(self.chromosomes_position.keys())
-        list_of_chrom.sort(key=lambda x: self.alphanum_key(x))
-
-        for chrom in list_of_chrom:
-            self.list_of_body_records_chrom.clear()
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                [executor.submit(self.multithread_test,input_file,chrom) for input_file in self.list_of_input_files]
+        for chrom in self.sorted_list_of_chromosomes():
+            with self.metrics.chromosome(chrom):
+                self.read_and_merge_specific_chrom(chrom)
+                self.write_specific_chrom_in_output_file()
 
+    def read_and_merge_specific_chrom(self, chrom):
+        """ Reads specific chromosome from all input files, removes duplicates, sorts and merges body records. Merged
+            records are placed in the list list_of_body_records_chrom. """
+        self.read_specific_chrom_in_input_files(chrom)
+        self.merge_specific_chrom(chrom)
+
+    def read_specific_chrom_in_input_files(self, chrom):
+        """ Reads specific chromosome from all input files in parallel threads into list_of_body_records_chrom.
+            Exceptions raised in the threads are raised here. """
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.list_of_body_records_chrom.clear()
+        with ThreadPoolExecutor(max_workers=self.reading_threads()) as executor:
+            futures = [executor.submit(self.multithread_test,input_file,chrom) for input_file in
+                       self.list_of_input_files]
+        for future in futures:
+            future.result()
+
+    def merge_specific_chrom(self, chrom=None):
+        """ Removes duplicates, sorts and merges body records in list_of_body_records_chrom.
+        :param chrom: chromosome of the records, used for metrics
+        """
+        with self.metrics.stage('adjust_body_records_to_samples', chrom):
             self.adjust_body_records_to_samples()
-            self.list_of_body_records_chrom = list(toolz.unique(self.list_of_body_records_chrom, key=lambda x: x.line))
-            self.list_of_body_records_chrom.sort(key=lambda x: self.alphanum_key(x.line))
-            if self.verify_and_merge_body_records():
-                self.write_specific_chrom_in_output_file()
+        number_of_records = len(self.list_of_body_records_chrom)
+        with self.metrics.stage('deduplicate_and_sort', chrom):
+            self.list_of_body_records_chrom = self.unique_body_records(self.list_of_body_records_chrom)
+            self.sort_body_records(self.list_of_body_records_chrom)
+        self.metrics.count('records_duplicate', number_of_records - len(self.list_of_body_records_chrom), chrom)
+        number_of_records = len(self.list_of_body_records_chrom)
+        with self.metrics.stage('merge', chrom):
+            self.verify_and_merge_body_records()
+        self.metrics.count('records_merged', number_of_records - len(self.list_of_body_records_chrom), chrom)
+
+    def stream_body_in_input_files_and_write(self):
+        """ Streaming alternative to read_body_in_input_files_and_write for input files sorted by position.
+            Merged records are written in batches of STREAMING_BATCH_SIZE records. """
+        self.prepare_samples_for_body_records()
+        for chrom in self.sorted_list_of_chromosomes():
+            with self.metrics.chromosome(chrom):
+                batch_of_body_records = []
+                for body_record in self.metrics.timed_iterator(self.stream_merged_body_records_of_specific_chrom(chrom),
+                                                               'read_and_merge', chrom):
+                    batch_of_body_records.append(body_record)
+                    if len(batch_of_body_records) >= self.STREAMING_BATCH_SIZE:
+                        self.list_of_body_records_chrom = batch_of_body_records
+                        self.write_specific_chrom_in_output_file()
+                        batch_of_body_records = []
+
+                self.list_of_body_records_chrom = batch_of_body_records
+                if len(self.list_of_body_records_chrom) > 0:
+                    self.write_specific_chrom_in_output_file()
+            self.check_if_input_file_invalid()
+            if self.invalid is True:
+                return
+
+    def stream_merged_body_records_of_specific_chrom(self, chrom):
+        """ Yields merged body records of specific chromosome from input files sorted by position. Records from all
+            input files are merged with a heap and grouped by position. Each group is filtered to remove duplicates,
+            sorted and merged on its own, so only records at one position are kept in memory. """
+        merged_records = heapq.merge(*self.sorted_iterators_of_specific_chrom(chrom), key=lambda x: x.sort_key)
+        number_of_records_read = 0
+        number_of_bytes_read = 0
+        for _, group in itertools.groupby(merged_records, key=lambda x: x.sort_key):
+            group_of_body_records = list(group)
+            number_of_records_read += len(group_of_body_records)
+            for body_object in group_of_body_records:
+                number_of_bytes_read += len(body_object.raw_line)
+                body_object.update_line()
+            group_of_body_records = self.unique_body_records(group_of_body_records)
+            self.sort_body_records(group_of_body_records)
+            yield from self.merge_body_records(group_of_body_records)
+        self.metrics.count('records_read', number_of_records_read, chrom)
+        self.metrics.count('bytes_read', number_of_bytes_read, chrom)
+
+    def sort_body_records(self, list_of_body_records):
+        """ Sorts body records of one chromosome by POS. Records with the same POS are sorted in natural order of
+            their lines, which decides the first record of every merged group, so the natural key is computed only
+            for them. """
+        positions = Counter(body_record.sort_key for body_record in list_of_body_records)
+        list_of_body_records.sort(key=lambda x: (x.sort_key, self.natural_key(x.line)
+                                                 if positions[x.sort_key] > 1 else ()))
+
+    @staticmethod
+    def natural_key(line):
+        """ Returns the same key as alphanum_key for the line as bytes, runs of digits are converted to integers in
+            one step. """
+        parts = Output_file.DIGITS.split(line)
+        parts[1::2] = map(int, parts[1::2])
+        return parts
+
+    def sorted_iterators_of_specific_chrom(self, chrom):
+        """ Returns at most max_open_files iterators of body records of specific chromosome sorted by position.
+            If there are more input files, records of every max_open_files input files are merged by position into
+            a temporary file, level by level (tree merging), so no more than max_open_files files are open. """
+        iterators = [(lambda input_file=input_file: input_file.iterate_sorted_specific_chrom_body_of_file(
+            chrom, self.regions)) for input_file in self.list_of_input_files]
+        while len(iterators) > self.max_open_files:
+            iterators = [self.merge_sorted_iterators_into_temporary_file(group)
+                         for group in self.partition(iterators, self.max_open_files)]
+        return [iterator() for iterator in iterators]
+
+    @staticmethod
+    def partition(items, size):
+        """ Splits items into consecutive lists of at most size items. """
+        return [items[index:index + size] for index in range(0, len(items), size)]
+
+    def merge_sorted_iterators_into_temporary_file(self, iterators):
+        """ Merges body records from iterators by position into a temporary file and returns function creating
+            iterator of the records in it. Original lines are written with index of their input file, so records are
+            read back exactly as they were read from the input file. """
+        import tempfile
+
+        index_of_input_file = {id(input_file.body_header_line): index
+                               for index, input_file in enumerate(self.list_of_input_files)}
+        temporary_file_descriptor, path = tempfile.mkstemp(suffix='.vcf')
+        with open(temporary_file_descriptor, 'wb') as temporary_file:
+            for body_record in heapq.merge(*[iterator() for iterator in iterators], key=lambda x: x.sort_key):
+                temporary_file.write(b'%d\t%b' % (index_of_input_file[id(body_record.body_header_line)],
+                                                  body_record.raw_line))
+        return lambda: self.iterate_temporary_file(path)
+
+    def iterate_temporary_file(self, path):
+        """ Yields body records from the temporary file of merge_sorted_iterators_into_temporary_file and removes
+            the file at the end. """
+        try:
+            with open(path, 'rb') as temporary_file:
+                for line in temporary_file:
+                    index, line = line.split(b'\t', 1)
+                    yield Body_record(line, self.list_of_input_files[int(index)].body_header_line)
+        finally:
+            os.remove(path)
+
+    def process_body_in_parallel_and_write(self):
+        """ Merges chromosomes in a pool of processes. Every worker reads and merges one chromosome from all input
+            files and returns it as bytes, or as BGZF blocks for compressed output. Chromosomes are submitted from
+            the largest to the smallest to avoid waiting on one big chromosome at the end, and finished chunks are
+            written in the order of chromosomes. BGZF blocks can be concatenated, so chunks are appended to the
+            output file as they are.
+            Requires fork start method, otherwise chromosomes are merged in this process. """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        global output_file_in_worker
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            self.read_body_in_input_files_and_write()
+            return
+
+        self.prepare_samples_for_body_records()
+        list_of_chrom = self.sorted_list_of_chromosomes()
+        chromosome_sizes = self.estimate_chromosome_sizes()
+        output_file_in_worker = self
+        with ProcessPoolExecutor(max_workers=self.processes,
+                                 mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = {chrom: executor.submit(merge_specific_chrom_in_worker, chrom)
+                       for chrom in sorted(list_of_chrom, key=lambda x: chromosome_sizes.get(x, 0), reverse=True)}
+            for chrom in list_of_chrom:
+                chunk, error_message, index_entries, metrics_of_chromosome = futures[chrom].result()
+                if error_message is not None:
+                    self.invalid = True
+                    self.error_message = error_message
+                    for future in futures.values():
+                        future.cancel()
+                    break
+                self.metrics.add_metrics_of_chromosome(chrom, metrics_of_chromosome)
+                with self.metrics.stage('write', chrom):
+                    if index_entries is not None:
+                        self.add_index_entries(index_entries)
+                    self.write_chunk_in_output_file(chunk)
+        output_file_in_worker = None
+
+    def estimate_chromosome_sizes(self):
+        """ Returns dictionary with estimated size of every chromosome summed over all input files. """
+        chromosome_sizes = {}
+        for input_file in self.list_of_input_files:
+            for chrom, size in input_file.estimate_chromosome_sizes().items():
+                chromosome_sizes[chrom] = chromosome_sizes.get(chrom, 0) + size
+        return chromosome_sizes
+
+    def sorted_list_of_chromosomes(self):
+        """ Returns names of all chromosomes from input files in the order they are written in the output file.
+            Chromosomes are ordered as in the reference index or ##contig header lines, chromosomes that are not
+            listed there come after them in natural order. If regions are given, only chromosomes with regions are
+            returned. For a shard of the scatter plan chromosomes of the shard are returned in the order of the plan.
+        """
+        if self.scatter_plan is not None:
+            return [chrom for chrom in self.scatter_plan.shards[self.shard] if chrom in self.chromosomes_position and
+                    (self.regions is None or chrom in self.regions.intervals)]
+        contig_order = self.determinate_contig_order()
+        list_of_chrom = [chrom for chrom in self.chromosomes_position.keys()
+                         if self.regions is None or chrom in self.regions.intervals]
+        list_of_chrom.sort(key=lambda x: (0, contig_order[x]) if x in contig_order else (1, self.alphanum_key(x)))
+        return list_of_chrom
+
+    def determinate_contig_order(self):
+        """ Returns dictionary that maps chromosome name to its position in the reference index (.fai) if it is
+            given, otherwise in the merged ##contig header lines. """
+        contig_order = {}
+        if self.path_to_reference_index:
+            with open(self.path_to_reference_index) as reference_index:
+                for line in reference_index:
+                    name = line.split('\t', 1)[0].strip()
+                    if name and name not in contig_order:
+                        contig_order[name] = len(contig_order)
+        else:
+            for contig in self.list_of_contigs:
+                if contig.ID not in contig_order:
+                    contig_order[contig.ID] = len(contig_order)
+        return contig_order
 
     def multithread_test(self, input_file, chrom):
-        input_file.read_specific_chrom_body_of_file(chrom)
+        with self.metrics.stage('body_read', chrom, input_file.path):
+            input_file.read_specific_chrom_body_of_file(chrom, self.regions)
+        if self.metrics.enabled:
+            self.metrics.count('records_read', len(input_file.list_of_body_records_chrom), chrom, input_file.path)
+            self.metrics.count('bytes_read', sum(len(body_record.raw_line) for body_record in
+                                                 input_file.list_of_body_records_chrom), chrom, input_file.path)
         self.list_of_body_records_chrom.extend(input_file.list_of_body_records_chrom)
 
     def check_if_input_file_invalid(self):
@@ -166,84 +668,119 @@ class Output_file:
             self.error_message = error_files[0].error_message
             self.invalid = True
 
-    def write_header_in_output_file(self):
-        """ Writes the header in the compressed or uncompressed output file. """
-        if self.compressed:
-            self.write_header_in_gz_file()
+    def open_output_file(self):
+        """ Opens the output file once for the whole run. Compressed output file is written through Bgzf_writer.
+            Output is written in the sink if it is given. Without the output path everything is printed on the
+            stdout. """
+        if self.sink is not None:
+            if self.compressed:
+                self.file = Bgzf_writer(self.sink, threads=self.threads, close_fileobj=False)
+            else:
+                self.file = self.sink
+        elif self.path:
+            if self.compressed:
+                self.file = Bgzf_writer(open(self.path, "wb"), threads=self.threads)
+                if self.write_index:
+                    self.tabix_index_writer = Tabix_index_writer()
+            else:
+                self.file = open(self.path, "wb", buffering=self.OUTPUT_BUFFER_SIZE)
+
+    def close_output_file(self):
+        """ Closes the output file. For compressed output file the end of file block is written, and the tabix or CSI
+            index is written next to it if requested. """
+        if self.file is not None:
+            if self.sink is not None and not self.compressed:
+                self.file.flush()
+            else:
+                self.file.close()
+            if self.compressed:
+                self.metrics.count('bytes_written_compressed', self.file.compressed_offset +
+                                   len(Bgzf_writer.EOF_BLOCK))
+            if self.tabix_index_writer is not None and self.invalid is not True:
+                self.tabix_index_writer.write(self.path, self.file.virtual_offset)
+            self.file = None
+
+    def index_entries_of_body_records(self, list_of_body_records):
+        """ Returns chromosome, interval and length in bytes of every body record, used for indexing output file. """
+        index_entries = []
+        for body_record in list_of_body_records:
+            beg, end = Tabix_index_writer.interval_of_vcf_record(body_record.pos, body_record.ref, body_record.info)
+            index_entries.append((body_record.chrom, beg, end, len(body_record.line)))
+        return index_entries
+
+    def add_index_entries(self, index_entries):
+        """ Adds records that will be written next in the output file to the index of the output file. """
+        offset = self.file.uncompressed_offset
+        for chrom, beg, end, length in index_entries:
+            self.tabix_index_writer.add_record(chrom, beg, end, offset, offset + length)
+            offset += length
+
+    def write_text_in_output_file(self, text):
+        """ Writes text in the compressed or uncompressed output file, or on the stdout, regarding input arguments. """
+        self.write_bytes_in_output_file(text.encode('utf-8'))
+
+    def write_bytes_in_output_file(self, data):
+        """ Writes bytes in the compressed or uncompressed output file, or on the stdout, regarding input arguments.
+        """
+        if self.file is None:
+            print(str(data, 'utf-8'), end='')
         else:
-            self.write_header()
+            self.file.write(data)
+
+    def write_header_in_output_file(self):
+        """ Opens the output file and writes the header in it. Only the first shard of the scatter plan has the
+            header. """
+        self.open_output_file()
+        if self.shard is not None and self.shard > 0:
+            return
+        self.write_text_in_output_file(self.header_text())
+
+    def header_text(self):
+        """ Returns merged header of the output file. """
+        return self.version + ''.join(list_item.line for list_item in self.list_of_header_objects) + \
+            self.body_header_line.line
 
     def write_specific_chrom_in_output_file(self):
         """ Writes records for specific chromosomes in compressed or uncompressed output files. """
-        if self.compressed:
-            self.write_body_in_gz_file()
-        else:
-            self.write_body()
-
-    def write_header(self):
-        """ Writes header in uncompressed file, or on the stdout, regarding input arguments. """
-        if self.path:
-            self.file = open(self.path, "w+")
-            self.file.write(self.version)
-            for list_item in self.list_of_header_objects:
-                self.file.write(list_item.line)
-            self.file.write(self.body_header_line.line)
-            self.file.close()
+        chrom = self.list_of_body_records_chrom[0].chrom if len(self.list_of_body_records_chrom) > 0 else None
+        with self.metrics.stage('write', chrom):
+            if self.tabix_index_writer is not None:
+                self.add_index_entries(self.index_entries_of_body_records(self.list_of_body_records_chrom))
+            data = b''.join(list_item.line for list_item in self.list_of_body_records_chrom)
+            self.write_bytes_in_output_file(data)
+        self.metrics.count('records_written', len(self.list_of_body_records_chrom), chrom)
+        self.metrics.count('bytes_written', len(data), chrom)
+
+    def write_chunk_in_output_file(self, chunk):
+        """ Writes already formatted chunk of the body in the output file. Chunk is bytes of lines for uncompressed
+            and BGZF blocks for compressed output file. """
+        if self.compressed and self.file is not None:
+            self.file.write_blocks(chunk)
         else:
-            print(self.version, end='')
-            for list_item in self.list_of_header_objects:
-                print(list_item.line, end='')
-            print(self.body_header_line.line, end='')
-
-    def write_body(self):
-        """ Writes body in the uncompressed file, or on the stdout, regarding input arguments. """
-        if self.path:
-            self.file = open(self.path, "a+")
-            for list_item in self.list_of_body_records_chrom:
-                self.file.write(list_item.line)
-            self.file.close()
-        else:
-            for list_item in self.list_of_body_records_chrom:
-                print(list_item.line, end='')
-
-    def write_header_in_gz_file(self):
-        """ Writes header in the compressed file, or on the stdout, regarding input arguments. """
-        if self.path:
-            with open(self.path, "w+b") as raw:
-                with bgzip.BGZipWriter(raw) as self.file:
-                    self.file.write(self.version.encode('utf-8'))
-                    for list_item in self.list_of_header_objects:
-                        self.file.write(list_item.line.encode('utf-8'))
-                    self.file.write(self.body_header_line.line.encode('utf-8'))
-        else:
-            for list_item in self.list_of_header_objects:
-                print(list_item.line.encode('utf-8'))
-
-    def write_body_in_gz_file(self):
-        """ Writes body in the compressed file, or on the stdout, regarding input arguments. """
-        if self.path:
-            with open(self.path, "a+b") as raw:
-                with bgzip.BGZipWriter(raw) as self.file:
-                    for list_item in self.list_of_body_records_chrom:
-                        self.file.write(list_item.line.encode('utf-8'))
-        else:
-            for list_item in self.list_of_body_records_chrom:
-                print(list_item.line.encode('utf-8'))
+            self.write_bytes_in_output_file(chunk)
 
     def adjust_body_records_to_samples(self):
         """ First make a list of samples that need to be combined if the list_of_samples_to_be_combined is empty.
             After that, each body record is adjusted to contain only the needed samples. """
+        self.prepare_samples_for_body_records()
+        for body_object in self.list_of_body_records_chrom:
+            body_object.update_line()
+
+    def prepare_samples_for_body_records(self):
+        """ Makes a list of samples that need to be combined if the list_of_samples_to_be_combined is empty and
+            shares it with body header line and body records. """
         if len(self.list_of_samples_to_be_combined) == 0:
             self.determinate_samples_to_be_combined()
         Body_header_line.list_of_samples_to_be_combined = self.list_of_samples_to_be_combined
         Body_record.list_of_samples_to_be_combined = self.list_of_samples_to_be_combined
-        for body_object in self.list_of_body_records_chrom:
-            body_object.update_line()
 
     def create_body_header_line_for_output(self):
-        """ Creates a body header line according to the samples. """
+        """ Creates a body header line according to the samples and computes columns of the samples in every input
+            file. """
         if len(self.list_of_samples_to_be_combined) == 0:
             self.determinate_samples_to_be_combined()
+        for input_file in self.list_of_input_files:
+            input_file.compute_columns_of_samples_to_be_combined(self.list_of_samples_to_be_combined)
         Body_header_line.list_of_samples_to_be_combined = self.list_of_samples_to_be_combined
         self.body_header_line = Body_header_line("")
         self.body_header_line.has_format_field = len(Body_header_line.list_of_samples_to_be_combined) > 0
@@ -268,101 +805,107 @@ class Output_file:
 
     def verify_and_merge_body_records(self):
         """ Verifies if the body records are valid and merge where possible. """
-        index = 0
-        while index + 1 < len(self.list_of_body_records_chrom):
-            if (self.check_condition_for_merging_records(self.list_of_body_records_chrom[index],
-                                                         self.list_of_body_records_chrom[index + 1])):
+        self.list_of_body_records_chrom = self.merge_body_records(self.list_of_body_records_chrom)
 
-                if self.list_of_body_records_chrom[index].ref == self.list_of_body_records_chrom[index + 1].ref:
-                    self.list_of_body_records_chrom[index].id = self.determinate_id(
-                        self.list_of_body_records_chrom[index].id, self.list_of_body_records_chrom[index + 1].id)
-
-                    self.list_of_body_records_chrom[index].alt = self.determinate_alt(
-                        self.list_of_body_records_chrom[index].alt, self.list_of_body_records_chrom[index + 1].alt)
-
-                    self.list_of_body_records_chrom[index].qual = self.determinate_qual(
-                        self.list_of_body_records_chrom[index].qual,
-                        self.list_of_body_records_chrom[index + 1].qual)
-
-                    self.determinate_info(self.list_of_body_records_chrom[index],
-                                          self.list_of_body_records_chrom[index + 1])
-
-                    self.list_of_body_records_chrom[index].update_line()
-
-                    del self.list_of_body_records_chrom[index + 1]
+        return True
 
-                else:
-                    index += 1
+    def merge_body_records(self, list_of_body_records):
+        """ Merges sorted body records and returns the list of merged records. Records are grouped in a single pass,
+            a group starts with a record and contains all following records that can be merged with it. Every group
+            is then merged into its first record in one step. """
+        merged_body_records = []
+        group_of_body_records = []
+        for body_record in list_of_body_records:
+            if len(group_of_body_records) > 0 and group_of_body_records[0].ref == body_record.ref and \
+                    self.check_condition_for_merging_records(group_of_body_records[0], body_record):
+                group_of_body_records.append(body_record)
             else:
-                index += 1
-
-        return True
+                if len(group_of_body_records) > 0:
+                    merged_body_records.append(self.merge_group_of_body_records(group_of_body_records))
+                group_of_body_records = [body_record]
+
+        if len(group_of_body_records) > 0:
+            merged_body_records.append(self.merge_group_of_body_records(group_of_body_records))
+        return merged_body_records
+
+    def merge_group_of_body_records(self, group_of_body_records):
+        """ Merges all body records in the group into the first one and returns it. """
+        body_record = group_of_body_records[0]
+        if len(group_of_body_records) > 1:
+            body_record.id = self.determinate_id(*[record.id for record in group_of_body_records])
+            body_record.alt = self.determinate_alt(*[record.alt for record in group_of_body_records])
+            body_record.qual = self.determinate_qual(*[record.qual for record in group_of_body_records])
+            self.determinate_info(*group_of_body_records)
+            body_record.update_line()
+        return body_record
+
+    @staticmethod
+    def unique_body_records(list_of_body_records):
+        """ Returns body records without records whose line is the same as the line of some previous record.
+            Records are looked up by line fingerprints and lines are compared only when fingerprints are equal, so
+            different lines are never removed. """
+        first_body_record_of_fingerprint = {}
+        unique_body_records = []
+        for body_record in list_of_body_records:
+            first_body_record = first_body_record_of_fingerprint.setdefault(body_record.line_fingerprint, body_record)
+            if first_body_record is body_record or first_body_record.line != body_record.line:
+                unique_body_records.append(body_record)
+        return unique_body_records
 
     def check_condition_for_merging_records(self, record_one, record_two):
-        """ Checks whether mering conditions for two body records are fulfilled. """
+        """ Checks whether merging conditions for two body records are fulfilled. Samples are compared by
+            fingerprints of FORMAT and the samples to be combined instead of splitting lines. """
         if record_one.pos == record_two.pos and record_one.chrom == record_two.chrom:
             if record_one.has_format_field and record_two.has_format_field:
                 if record_one.format != record_two.format:
                     return not self.keep_variants_different_format
-                else:
-                    samples_data_record_one = (record_one.line.split('\t'))[8:]
-                    samples_data_record_two = (record_two.line.split('\t'))[8:]
-
-                    if len(samples_data_record_one) == len(samples_data_record_two):
-                        index = 1
-                        while index < len(samples_data_record_one):
-                            if samples_data_record_one[index] != samples_data_record_two[index]:
-                                return False
-                            index += 1
+                elif record_one.samples_fingerprint != record_two.samples_fingerprint:
+                    return False
             else:
                 return True
         else:
             return False
 
-    def determinate_info(self, record_one, record_two):
-        """ Determinate merging info of two body records. """
-        info_data = {}
-        for key, value in record_one.data_from_info.items():
-            if key in record_two.data_from_info:
-                if value == record_two.data_from_info[key]:
+    def determinate_info(self, record_one, *other_records):
+        """ Determinate merging info of body records. Values that differ between records are dropped, the key can
+            be added again by a following record. The result is set in record_one. """
+        info_data = dict(record_one.data_from_info)
+        for record in other_records:
+            for key, value in record.data_from_info.items():
+                if key in info_data:
+                    if info_data[key] != value:
+                        del info_data[key]
+                else:
                     info_data[key] = value
-            else:
-                info_data[key] = value
-
-        for key, value in record_two.data_from_info.items():
-            if key not in record_one.data_from_info:
-                info_data[key] = value
 
         record_one.update_data_from_info(info_data)
 
-    def determinate_id(self, id_one, id_two):
-        """ Determinate merging id of two body records. """
-        if id_one == id_two:
-            return id_one
-        if id_one == ".":
-            return id_two
-        if id_two == ".":
-            return id_one
-        return id_one + "," + id_two
-
-    def determinate_qual(self, qual_one, qual_two):
-        """ Determinate merging qual of two body records. """
-        if qual_one == qual_two:
-            return qual_one
-        if qual_one == ".":
-            return qual_two
-        if qual_two == ".":
-            return qual_one
-        if float(qual_one) < float(qual_two):
-            return qual_one
-        return qual_one
-
-    def determinate_alt(self, alt_one, alt_two):
-        """ Determinate merging alt of two body records. """
-        if alt_one == alt_two:
-            return alt_one
-        if alt_one == ".":
-            return alt_two
-        if alt_two == ".":
-            return alt_one
-        return alt_one + "," + alt_two
+    def determinate_id(self, *ids):
+        """ Determinate merging id of body records. """
+        return self.join_values(ids)
+
+    def determinate_qual(self, *quals):
+        """ Determinate merging qual of body records. The first qual that is not missing is kept. """
+        for qual in quals:
+            if qual != ".":
+                return qual
+        return quals[0]
+
+    def determinate_alt(self, *alts):
+        """ Determinate merging alt of body records. """
+        return self.join_values(alts)
+
+    @staticmethod
+    def join_values(values):
+        """ Joins values with comma in order. Missing value (.) is replaced by the next one, and a value equal to
+            everything joined so far is skipped. """
+        joined_parts = values[0].split(',')
+        for value in values[1:]:
+            parts = value.split(',')
+            if parts == joined_parts or value == ".":
+                continue
+            if joined_parts == ["."]:
+                joined_parts = parts
+            else:
+                joined_parts.extend(parts)
+        return ','.join(joined_parts)
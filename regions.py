@@ -0,0 +1,64 @@
+import re
+
+from bisect import bisect_right
+
+
+class Regions:
+    """ Genomic regions the combining is restricted to. Regions are given as strings chr, chr:start or
+        chr:start-end (1-based, inclusive) or in a BED file (0-based, half-open). Internally every chromosome
+        has a sorted list of merged 0-based half-open intervals.
+    """
+    REGION_PATTERN = re.compile(r'^(.+):(\d+)(?:-(\d+))?$')
+    MAX_POSITION = 1 << 62
+
+    def __init__(self):
+        """ Create and initialize empty Regions. """
+        self.intervals = {}
+        self.interval_starts = {}
+
+    def add_interval(self, chrom, beg, end):
+        """ Adds 0-based half-open interval [beg, end) on the chromosome. """
+        if end <= beg:
+            raise ValueError(f'Invalid region {chrom}:{beg + 1}-{end}.')
+        self.intervals.setdefault(chrom, []).append((beg, end))
+
+    def add_region_string(self, region):
+        """ Adds region given as chr, chr:start or chr:start-end. """
+        region = region.strip()
+        match = self.REGION_PATTERN.match(region)
+        if match is None:
+            self.add_interval(region, 0, self.MAX_POSITION)
+        else:
+            end = int(match.group(3)) if match.group(3) is not None else self.MAX_POSITION
+            self.add_interval(match.group(1), max(int(match.group(2)) - 1, 0), end)
+
+    def read_bed_file(self, path):
+        """ Adds all regions from the BED file. """
+        with open(path) as bed_file:
+            for line in bed_file:
+                if line.strip() == '' or line.startswith(('#', 'track', 'browser')):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 3:
+                    raise ValueError(f'Invalid line in BED file {path}: {line.strip()}')
+                self.add_interval(fields[0], int(fields[1]), int(fields[2]))
+
+    def merge_intervals(self):
+        """ Sorts and merges overlapping intervals of every chromosome. Must be called after all regions are added. """
+        for chrom, intervals in self.intervals.items():
+            merged_intervals = []
+            for beg, end in sorted(intervals):
+                if len(merged_intervals) > 0 and beg <= merged_intervals[-1][1]:
+                    merged_intervals[-1] = (merged_intervals[-1][0], max(end, merged_intervals[-1][1]))
+                else:
+                    merged_intervals.append((beg, end))
+            self.intervals[chrom] = merged_intervals
+            self.interval_starts[chrom] = [beg for beg, _ in merged_intervals]
+
+    def overlaps(self, chrom, beg, end):
+        """ Checks whether [beg, end) on the chromosome overlaps some region. """
+        intervals = self.intervals.get(chrom)
+        if not intervals:
+            return False
+        index = bisect_right(self.interval_starts[chrom], end - 1) - 1
+        return index >= 0 and intervals[index][1] > beg
@@ -0,0 +1,93 @@
+import json
+import os
+
+from bgzf_reader import Bgzf_reader
+from bgzf_writer import Bgzf_writer
+
+
+class Scatter_plan:
+    """ Plan for splitting one combining of input files into shards that can be merged independently, e.g. on
+        different machines. Every shard is a run of consecutive chromosomes in the output order, shards are balanced
+        by estimated sizes of chromosomes. The plan also fixes paths of input files and samples, so all shards write
+        the same columns. Shard 0 holds the header, so chunks of all shards concatenated in order form the output file.
+    """
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, list_of_input_files_paths=None, list_of_samples=None, shards=None):
+        """ Create and initialize a Scatter_plan.
+        :param list_of_input_files_paths: paths of all input files
+        :param list_of_samples: samples written in the output, in the order of columns
+        :param shards: list of shards, every shard is a list of chromosomes
+        """
+        self.list_of_input_files_paths = list_of_input_files_paths if list_of_input_files_paths is not None else []
+        self.list_of_samples = list_of_samples if list_of_samples is not None else []
+        self.shards = shards if shards is not None else []
+        self.invalid = False
+        self.error_message = ""
+
+    @staticmethod
+    def balanced_shards(list_of_chrom, chromosome_sizes, number_of_shards):
+        """ Splits ordered chromosomes into number_of_shards runs of consecutive chromosomes with similar sizes.
+            Chromosome goes to the shard where the middle of its size falls in the cumulative size. """
+        shards = [[] for _ in range(number_of_shards)]
+        total_size = sum(chromosome_sizes.get(chrom, 0) for chrom in list_of_chrom)
+        cumulative_size = 0
+        for index, chrom in enumerate(list_of_chrom):
+            size = chromosome_sizes.get(chrom, 0)
+            if total_size > 0:
+                shard = int((cumulative_size + size / 2) * number_of_shards / total_size)
+            else:
+                shard = index * number_of_shards // len(list_of_chrom)
+            shards[min(shard, number_of_shards - 1)].append(chrom)
+            cumulative_size += size
+        return shards
+
+    def write(self, path):
+        """ Writes the plan in the JSON file. """
+        with open(path, 'w') as plan_file:
+            json.dump({'input_files': self.list_of_input_files_paths, 'samples': self.list_of_samples,
+                       'shards': self.shards}, plan_file, indent=1)
+
+    def read(self, path):
+        """ Reads the plan from the JSON file. If the file is not a valid plan invalid is set to True and appropriate
+            error message is set. """
+        try:
+            with open(path) as plan_file:
+                plan = json.load(plan_file)
+            self.list_of_input_files_paths = list(plan['input_files'])
+            self.list_of_samples = list(plan['samples'])
+            self.shards = [list(shard) for shard in plan['shards']]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.invalid = True
+            self.error_message = f'Invalid scatter plan: {path}'
+
+    @staticmethod
+    def gather_chunks(list_of_chunks_paths, path):
+        """ Concatenates chunks of all shards in order into the output file. Chunks are copied byte for byte, only
+            the end of file block of every BGZF chunk is left out and written once at the end of the output file.
+            Returns error message if chunks can't be gathered, otherwise None. """
+        for chunk_path in list_of_chunks_paths:
+            if not os.path.isfile(chunk_path):
+                return f'No such file {chunk_path}.'
+        compressed = [Bgzf_reader.is_bgzf(chunk_path) for chunk_path in list_of_chunks_paths]
+        if len(set(compressed)) > 1:
+            return 'Chunks must be all compressed or all uncompressed.'
+
+        with open(path, 'wb') as output_file:
+            for chunk_path in list_of_chunks_paths:
+                size = os.path.getsize(chunk_path)
+                with open(chunk_path, 'rb') as chunk_file:
+                    if compressed[0] and size >= len(Bgzf_writer.EOF_BLOCK):
+                        chunk_file.seek(size - len(Bgzf_writer.EOF_BLOCK))
+                        if chunk_file.read() == Bgzf_writer.EOF_BLOCK:
+                            size -= len(Bgzf_writer.EOF_BLOCK)
+                        chunk_file.seek(0)
+                    while size > 0:
+                        data = chunk_file.read(min(size, Scatter_plan.COPY_BUFFER_SIZE))
+                        if not data:
+                            break
+                        output_file.write(data)
+                        size -= len(data)
+            if compressed[0]:
+                output_file.write(Bgzf_writer.EOF_BLOCK)
+        return None
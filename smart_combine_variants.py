@@ -7,7 +7,10 @@ This tools performs combining of two or more vcf files into one according to the
 Copyright (c) ETF Beograd
 
 Usage: 
-    smart_combine_variants.py (-i <inputVCF.vcf>)... [-s <sample_name>] [-f <output_format>] [-o <out>] [options]
+    smart_combine_variants.py [scatter] (-i <inputVCF.vcf>)... [-s <sample_name>] [-f <output_format>] [-o <out>] [options]
+    smart_combine_variants.py --plan <plan.json> --shard <shard> [-f <output_format>] [-o <out>] [options]
+    smart_combine_variants.py gather -o <out> <chunk>...
+    smart_combine_variants.py --manifest <jobs.tsv> [-f <output_format>] [options]
 
 Options:
 
@@ -30,6 +33,74 @@ Options:
 
     -k,--keep_variants_with_different_format    Keep variants with same CHROM, POS, REF and ALT, but different format in the output file.
 
+    --write_index                       Write tabix (.tbi) index next to the compressed output file, or CSI (.csi)
+                                        index if some position is beyond 2^29.
+
+    --reference_index <fai>             FASTA index (.fai) of the reference. Chromosomes are written in the order of the
+                                        reference index instead of the order of ##contig header lines.
+
+    --processes <processes>             Number of processes merging chromosomes in parallel. Chromosomes are
+                                        written in order, compressed output is compressed in the processes too
+                                        [default: 1].
+
+    --threads <threads>                 Number of threads compressing BGZF blocks of the compressed output file
+                                        [default: 1].
+
+    --decompression_threads <threads>   Number of threads decompressing BGZF blocks of every compressed input file
+                                        ahead of reading, at most 4 blocks per thread are kept ahead [default: 1].
+
+    --cache_dir <cache_dir>             Directory for caching positions of chromosomes in input files that have no
+                                        tabix or CSI index. Cached positions are reused while input file is unchanged.
+
+    --cache_size <cache_size>           Maximal size of the cache directory in MB [default: 100].
+
+    --metrics <metrics.json>            Write metrics in the JSON file: wall and CPU time of stages (header read,
+                                        extract_chromosomes, body read of every input file, adjusting records to
+                                        samples, deduplication and sorting, merging and writing), counts of records
+                                        and bytes read and written and peak RSS, in total and per chromosome.
+
+    --profile <profile.prof>            Profile every chromosome with cProfile and write the profile of the slowest
+                                        chromosome in the file (readable with pstats). Not used with --processes.
+
+    --max_open_files <max_open_files>   Maximal number of input files open at the same time. Handles of input files
+                                        are reused across chromosomes. With --streaming and more input files, groups
+                                        of input files are merged into temporary files first [default: 256].
+
+    --streaming                         Merge input files sorted by position record by record, keeping in memory only
+                                        records at one position instead of the whole chromosome.
+
+    -r,--regions <regions>              Combine only records overlapping comma separated regions chr, chr:start or
+                                        chr:start-end (1-based, inclusive). Indexed input files are read only
+                                        in the chunks overlapping the regions.
+
+    -R,--regions_file <bed>             Combine only records overlapping regions from the BED file.
+
+    --shards <shards>                   Number of shards the scatter command splits chromosomes into. Shards are
+                                        balanced by estimated sizes of chromosomes. Required by the scatter command,
+                                        which writes the plan in the output file (-o).
+
+    --plan <plan.json>                  Scatter plan written by the scatter command.
+
+    --shard <shard>                     Merge only chromosomes of this shard (counted from 0) of the scatter plan.
+                                        Only shard 0 has the header. Input files and samples are taken from the plan.
+
+    --header_only                       Write only the merged header of input files. Bodies of input files are not
+                                        read. Conflicting definitions of the same tag and ID are reported.
+
+    --validate_only                     Only check input files, nothing is written: headers, required samples and
+                                        body records (number of fields, REF different from ALT, records of every
+                                        chromosome contiguous and sorted by position). Input files are checked in
+                                        parallel processes, --processes of them if given. Prints number of records
+                                        and chromosomes and seconds for every input file. Exit status is 1 if some
+                                        input file is invalid.
+
+    --manifest <jobs.tsv>               Run many combining jobs in one process. Every line of the tab separated file
+                                        is one job: output file, comma separated input files and optionally comma
+                                        separated samples. Other options apply to all jobs, --processes is the number
+                                        of jobs running in parallel. Headers and positions of chromosomes of input
+                                        files used by more jobs are read only once. Prints summary of all jobs. Exit
+                                        status is 1 if the manifest is invalid or some job failed.
+
 Example:
 smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -s NORMAL -f UNCOMPRESSED -o combined.vcf -v
 smart_combine_variants.py -i data/test/v1.vcf    -i data/test/v2.vcf -s NORMAL -o combined.vcf
@@ -37,28 +108,79 @@ smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -s NORMA
 smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf -v
 smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -i v3.vcf -o combined.vcf -k
 smart_combine_variants.py -i data/test/v1.vcf    -i data/test/v2.vcf.gz -v -k
+smart_combine_variants.py -i data/test/v1.vcf    -i data/test/v2.vcf -o combined.vcf --cache_dir ~/.cache/scv
+smart_combine_variants.py -i data/test/v1.vcf    -i data/test/v2.vcf -o combined.vcf --reference_index ref.fa.fai
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -f COMPRESSED -o combined.vcf --processes 16
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -f COMPRESSED -o combined.vcf --threads 8
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf --decompression_threads 4
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -f COMPRESSED -o combined.vcf --write_index
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf --streaming
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf --metrics metrics.json
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf --streaming --max_open_files 64
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf -r chr1:10000-20000,chr2
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -o combined.vcf -R targets.bed
+smart_combine_variants.py scatter -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz --shards 2 -o plan.json
+smart_combine_variants.py --plan plan.json --shard 0 -f COMPRESSED -o shard0.vcf.gz
+smart_combine_variants.py --plan plan.json --shard 1 -f COMPRESSED -o shard1.vcf.gz
+smart_combine_variants.py gather -o combined.vcf.gz shard0.vcf.gz shard1.vcf.gz
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -f UNCOMPRESSED -o header.vcf --header_only
+smart_combine_variants.py -i data/test/v1.vcf.gz -i data/test/v2.vcf.gz -s NORMAL --validate_only
+smart_combine_variants.py --manifest jobs.tsv -f COMPRESSED --processes 8
 
 """
 
+import sys
 import time
 from docopt import docopt
+from manifest import Manifest
 from output_file import Output_file
+from scatter_plan import Scatter_plan
 from sys import stderr
 
 
 start_time = time.time()
+exit_status = 0
 
 if __name__ == '__main__':
     arguments = docopt(__doc__)
 
-    output_file = Output_file(arguments)
-    if output_file.invalid is True:
-        print(output_file.error_message)
-
-    elif output_file.process_input_files() is False:
-        print(output_file.error_message)
+    if arguments['gather']:
+        error_message = Scatter_plan.gather_chunks(arguments['<chunk>'], arguments['--out'])
+        if error_message is not None:
+            print(error_message)
+
+    elif arguments['--manifest']:
+        manifest = Manifest(arguments)
+        if manifest.invalid is True:
+            print(manifest.error_message)
+            exit_status = 1
+        else:
+            if manifest.run() is False:
+                exit_status = 1
+            print(manifest.summary(), end='')
+
+    else:
+        output_file = Output_file(arguments)
+        if output_file.invalid is True:
+            print(output_file.error_message)
+
+        elif arguments['--validate_only']:
+            valid = output_file.validate_input_files()
+            print(output_file.validation_report(), end='')
+            if not valid:
+                print(output_file.error_message)
+                exit_status = 1
+
+        elif arguments['scatter']:
+            if output_file.scatter_input_files() is False:
+                print(output_file.error_message)
+
+        elif output_file.process_input_files() is False:
+            print(output_file.error_message)
+            exit_status = 1
 
     if arguments['--verbose']:
         print("--- %s seconds ---" % (time.time() - start_time), file=stderr)
 
     stderr.close()
+    sys.exit(exit_status)
@@ -0,0 +1,165 @@
+import gzip
+import struct
+
+
+class Tabix_index:
+    """ Represents a tabix (.tbi) or CSI (.csi) index of a BGZF compressed VCF file.
+        For every reference sequence the index holds bins with chunks of virtual offsets, so the virtual offset
+        where each chromosome starts can be found without decompressing the VCF file.
+    """
+    TBI_MAGIC = b'TBI\x01'
+    CSI_MAGIC = b'CSI\x01'
+
+    def __init__(self, path, contig_names=None):
+        """ Create and initialize a Tabix_index.
+        :param path: path to the .tbi or .csi file
+        :param contig_names: names of references taken from the ##contig header lines, used for CSI indexes
+                             that do not store reference names themselves
+        """
+        self.path = path
+        self.csi = False
+        self.min_shift = 14
+        self.depth = 5
+        self.names = []
+        self.bins = []
+        self.linear_offsets = []
+        self.contig_names = contig_names if contig_names is not None else []
+        self.read_index()
+
+    def read_index(self):
+        """ Decompresses and parses the index file. ValueError is raised if the file is not a valid index. """
+        with gzip.open(self.path) as index_file:
+            data = index_file.read()
+
+        magic = data[:4]
+        if magic == self.TBI_MAGIC:
+            number_of_references = struct.unpack_from('<i', data, 4)[0]
+            offset = self.read_names(data, 8)
+        elif magic == self.CSI_MAGIC:
+            self.csi = True
+            self.min_shift, self.depth, length_of_aux = struct.unpack_from('<iii', data, 4)
+            offset = 16
+            if length_of_aux >= 28:
+                self.read_names(data, offset)
+            offset += length_of_aux
+            number_of_references = struct.unpack_from('<i', data, offset)[0]
+            offset += 4
+            if len(self.names) == 0:
+                self.names = self.contig_names[:number_of_references]
+        else:
+            raise ValueError(f'Unknown index format in file: {self.path}')
+
+        if len(self.names) < number_of_references:
+            raise ValueError(f'Names of references are missing in index file: {self.path}')
+
+        for _ in range(number_of_references):
+            offset = self.read_reference(data, offset)
+
+    def read_names(self, data, offset):
+        """ Reads the tabix configuration and reference names starting at offset. Returns offset after names. """
+        length_of_names = struct.unpack_from('<7i', data, offset)[6]
+        offset += 28
+        self.names = [str(name, 'utf-8') for name in data[offset:offset + length_of_names].split(b'\x00')[:-1]]
+        return offset + length_of_names
+
+    def read_reference(self, data, offset):
+        """ Reads bins (and linear index for tbi) of one reference. Returns offset after the reference. """
+        bins = {}
+        number_of_bins = struct.unpack_from('<i', data, offset)[0]
+        offset += 4
+        for _ in range(number_of_bins):
+            if self.csi:
+                bin_number, _loffset, number_of_chunks = struct.unpack_from('<IQi', data, offset)
+                offset += 16
+            else:
+                bin_number, number_of_chunks = struct.unpack_from('<Ii', data, offset)
+                offset += 8
+            chunks = list(struct.unpack_from(f'<{2 * number_of_chunks}Q', data, offset))
+            offset += 16 * number_of_chunks
+            bins[bin_number] = list(zip(chunks[0::2], chunks[1::2]))
+        self.bins.append(bins)
+
+        if self.csi:
+            self.linear_offsets.append([])
+        else:
+            number_of_intervals = struct.unpack_from('<i', data, offset)[0]
+            offset += 4
+            self.linear_offsets.append(list(struct.unpack_from(f'<{number_of_intervals}Q', data, offset)))
+            offset += 8 * number_of_intervals
+        return offset
+
+    def pseudo_bin(self):
+        """ Number of the bin that holds metadata instead of chunks. """
+        return self.pseudo_bin_for_depth(self.depth)
+
+    @staticmethod
+    def pseudo_bin_for_depth(depth):
+        """ Number of the bin that holds metadata for the binning scheme with the given depth. """
+        return ((1 << (3 * depth + 3)) - 1) // 7 + 1
+
+    @staticmethod
+    def reg2bin(beg, end, min_shift=14, depth=5):
+        """ Returns the smallest bin that contains 0-based half-open region [beg, end). """
+        end -= 1
+        shift = min_shift
+        first_bin_of_level = ((1 << (3 * depth)) - 1) // 7
+        for level in range(depth, 0, -1):
+            if beg >> shift == end >> shift:
+                return first_bin_of_level + (beg >> shift)
+            shift += 3
+            first_bin_of_level -= 1 << (3 * (level - 1))
+        return 0
+
+    @staticmethod
+    def reg2bins(beg, end, min_shift=14, depth=5):
+        """ Returns all bins that may contain records overlapping 0-based half-open region [beg, end). """
+        bins = []
+        end -= 1
+        shift = min_shift + 3 * depth
+        first_bin_of_level = 0
+        for level in range(depth + 1):
+            bins.extend(range(first_bin_of_level + (beg >> shift), first_bin_of_level + (end >> shift) + 1))
+            shift -= 3
+            first_bin_of_level += 1 << (3 * level)
+        return bins
+
+    def chunks_of_regions(self, chrom, intervals):
+        """ Returns sorted and merged chunks of virtual offsets that hold all records of the chromosome
+            overlapping the intervals. Linear index (tbi only) is used to skip chunks ending before an interval.
+        :param chrom: name of the chromosome
+        :param intervals: list of 0-based half-open intervals
+        """
+        if chrom not in self.names:
+            return []
+        reference = self.names.index(chrom)
+        bins = self.bins[reference]
+        linear_offsets = self.linear_offsets[reference]
+        max_position = 1 << (self.min_shift + 3 * self.depth)
+
+        chunks = []
+        for beg, end in intervals:
+            beg, end = min(beg, max_position - 1), min(end, max_position)
+            min_offset = 0
+            if len(linear_offsets) > 0:
+                min_offset = linear_offsets[min(beg >> self.min_shift, len(linear_offsets) - 1)]
+            for bin_number in self.reg2bins(beg, end, self.min_shift, self.depth):
+                chunks.extend(chunk for chunk in bins.get(bin_number, ()) if chunk[1] > min_offset)
+
+        merged_chunks = []
+        for start, end in sorted(chunks):
+            if len(merged_chunks) > 0 and start <= merged_chunks[-1][1]:
+                merged_chunks[-1] = (merged_chunks[-1][0], max(end, merged_chunks[-1][1]))
+            else:
+                merged_chunks.append((start, end))
+        return merged_chunks
+
+    def chromosomes_positions(self):
+        """ Returns dictionary with the virtual offset of the first record of every indexed chromosome. """
+        chromosomes_positions = {}
+        pseudo_bin = self.pseudo_bin()
+        for name, bins in zip(self.names, self.bins):
+            chunk_starts = [chunk[0] for bin_number, chunks in bins.items() if bin_number != pseudo_bin
+                            for chunk in chunks]
+            if len(chunk_starts) > 0:
+                chromosomes_positions[name] = [min(chunk_starts)]
+        return chromosomes_positions
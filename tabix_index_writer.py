@@ -0,0 +1,133 @@
+import re
+import struct
+
+from bgzf_writer import Bgzf_writer
+from tabix_index import Tabix_index
+
+
+class Tabix_index_writer:
+    """ Builds a tabix (.tbi) or CSI (.csi) index of the BGZF output file while records are written.
+        Records are added with their offsets in the uncompressed output. Chunks are collected per 16 kb window
+        pair, so the binning scheme can be chosen at the end: tbi when all records end before 2^29, csi with deeper
+        binning otherwise. Offsets are converted to virtual offsets when the index is written.
+    """
+    MIN_SHIFT = 14
+    TBI_DEPTH = 5
+    TBI_MAX_POSITION = 1 << 29
+    VCF_CONFIGURATION = (2, 1, 2, 0, ord('#'), 0)
+    END_IN_INFO = re.compile(r'(?:^|;)END=(\d+)(?:;|$)')
+
+    def __init__(self):
+        """ Create and initialize a Tabix_index_writer. """
+        self.names = []
+        self.references = {}
+        self.max_end = 0
+
+    @staticmethod
+    def interval_of_vcf_record(pos, ref, info):
+        """ Returns 0-based half-open interval covered by the VCF record. END from INFO is used if present. """
+        beg = int(pos) - 1
+        end = beg + max(len(ref), 1)
+        match = Tabix_index_writer.END_IN_INFO.search(info)
+        if match is not None and int(match.group(1)) > end:
+            end = int(match.group(1))
+        return beg, end
+
+    def add_record(self, chrom, beg, end, start_offset, end_offset):
+        """ Adds record covering [beg, end) stored between start_offset and end_offset of the uncompressed output. """
+        reference = self.references.get(chrom)
+        if reference is None:
+            self.names.append(chrom)
+            reference = {'chunks': {}, 'linear': {}, 'start': start_offset, 'end': end_offset, 'count': 0}
+            self.references[chrom] = reference
+
+        key = (beg >> self.MIN_SHIFT, (end - 1) >> self.MIN_SHIFT)
+        chunks = reference['chunks'].setdefault(key, [])
+        if len(chunks) > 0 and chunks[-1][1] == start_offset:
+            chunks[-1][1] = end_offset
+        else:
+            chunks.append([start_offset, end_offset])
+
+        linear = reference['linear']
+        for window in range(key[0], key[1] + 1):
+            if window not in linear:
+                linear[window] = start_offset
+        reference['end'] = end_offset
+        reference['count'] += 1
+        self.max_end = max(self.max_end, end)
+
+    def depth(self):
+        """ Returns depth of the binning scheme needed for the longest record end. """
+        depth = self.TBI_DEPTH
+        while self.max_end > 1 << (self.MIN_SHIFT + 3 * depth):
+            depth += 1
+        return depth
+
+    def write(self, path_of_vcf, virtual_offset):
+        """ Writes the index next to the output file and returns its path.
+        :param path_of_vcf: path to the BGZF output file
+        :param virtual_offset: function converting offset in the uncompressed output into virtual offset
+        """
+        depth = self.depth()
+        csi = depth > self.TBI_DEPTH
+        names = b''.join(name.encode('utf-8') + b'\x00' for name in self.names)
+        configuration = struct.pack('<7i', *self.VCF_CONFIGURATION, len(names)) + names
+        if csi:
+            data = [b'CSI\x01', struct.pack('<iii', self.MIN_SHIFT, depth, len(configuration)), configuration,
+                    struct.pack('<i', len(self.names))]
+        else:
+            data = [b'TBI\x01', struct.pack('<i', len(self.names)), configuration]
+
+        for name in self.names:
+            data.append(self.pack_reference(self.references[name], depth, csi, virtual_offset))
+        data.append(struct.pack('<Q', 0))
+
+        path_to_idx = path_of_vcf + ('.csi' if csi else '.tbi')
+        with Bgzf_writer(open(path_to_idx, 'wb')) as index_file:
+            index_file.write(b''.join(data))
+        return path_to_idx
+
+    def pack_reference(self, reference, depth, csi, virtual_offset):
+        """ Packs bins, chunks and (for tbi) linear index of one reference. Chunks of a bin are merged when the next
+            chunk starts in the BGZF block where the previous one ends, as tabix does. """
+        bins = {}
+        for (first_window, last_window), chunks in reference['chunks'].items():
+            bin_number = Tabix_index.reg2bin(first_window << self.MIN_SHIFT, (last_window + 1) << self.MIN_SHIFT,
+                                             self.MIN_SHIFT, depth)
+            bins.setdefault(bin_number, []).extend(chunks)
+
+        data = [struct.pack('<i', len(bins) + 1)]
+        for bin_number in sorted(bins):
+            chunks = sorted((virtual_offset(start), virtual_offset(end)) for start, end in bins[bin_number])
+            merged_chunks = [list(chunks[0])]
+            for start, end in chunks[1:]:
+                if start >> 16 <= merged_chunks[-1][1] >> 16:
+                    merged_chunks[-1][1] = max(end, merged_chunks[-1][1])
+                else:
+                    merged_chunks.append([start, end])
+            if csi:
+                data.append(struct.pack('<IQi', bin_number, merged_chunks[0][0], len(merged_chunks)))
+            else:
+                data.append(struct.pack('<Ii', bin_number, len(merged_chunks)))
+            data.append(struct.pack(f'<{2 * len(merged_chunks)}Q', *[offset for chunk in merged_chunks
+                                                                     for offset in chunk]))
+
+        start, end = virtual_offset(reference['start']), virtual_offset(reference['end'])
+        if csi:
+            data.append(struct.pack('<IQi', Tabix_index.pseudo_bin_for_depth(depth), start, 2))
+        else:
+            data.append(struct.pack('<Ii', Tabix_index.pseudo_bin_for_depth(depth), 2))
+        data.append(struct.pack('<4Q', start, end, reference['count'], 0))
+
+        if not csi:
+            linear = reference['linear']
+            number_of_windows = max(linear) + 1
+            offsets = []
+            previous_offset = virtual_offset(reference['start'])
+            for window in range(number_of_windows):
+                if window in linear:
+                    previous_offset = virtual_offset(linear[window])
+                offsets.append(previous_offset)
+            data.append(struct.pack('<i', number_of_windows))
+            data.append(struct.pack(f'<{number_of_windows}Q', *offsets))
+        return b''.join(data)
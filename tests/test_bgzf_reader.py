@@ -0,0 +1,62 @@
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bgzf_reader import Bgzf_reader
+from bgzf_writer import Bgzf_writer
+
+LINES = [f'1\t{position}\t.\tA\tG\t50\tPASS\tDP={position % 97}\n'.encode('utf-8') for position in range(1, 50001)]
+
+
+class Test_bgzf_reader(unittest.TestCase):
+    """ Reading BGZF files with and without decompressing blocks ahead in threads. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'lines.gz')
+        self.data = bytearray(Bgzf_writer.compress_to_blocks(b''.join(LINES)))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def block_starts(self):
+        """ Returns compressed offsets of all BGZF blocks in data. """
+        block_starts = []
+        block_start = 0
+        while block_start < len(self.data):
+            block_starts.append(block_start)
+            block_start += struct.unpack('<H', self.data[block_start + 16:block_start + 18])[0] + 1
+        return block_starts
+
+    def read_lines(self, threads):
+        with open(self.path, 'wb') as bgzf_file:
+            bgzf_file.write(self.data)
+        with Bgzf_reader(self.path, threads) as reader:
+            return list(reader)
+
+    def test_read_lines(self):
+        for threads in (1, 4):
+            with self.subTest(threads=threads):
+                self.assertEqual(self.read_lines(threads), LINES)
+
+    def test_corrupted_block(self):
+        block_starts = self.block_starts()
+        self.assertGreater(len(block_starts), 4)
+        data = bytes(self.data)
+        # Last byte of deflate data makes the stream invalid, a flipped bit in the middle of the block usually
+        # decompresses into different data, which is found by CRC32.
+        for corrupted_offset in (block_starts[4] - 9, (block_starts[3] + block_starts[4]) // 2):
+            for threads in (1, 4):
+                with self.subTest(corrupted_offset=corrupted_offset, threads=threads):
+                    self.data = bytearray(data)
+                    self.data[corrupted_offset] ^= 0x01
+                    with self.assertRaisesRegex(ValueError, f'Corrupt BGZF block at offset {block_starts[3]} '):
+                        self.read_lines(threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
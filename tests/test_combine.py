@@ -0,0 +1,96 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from combine import combine, write_combined
+
+SMART_COMBINE_VARIANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smart_combine_variants.py')
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'test')
+
+
+class Test_combine(unittest.TestCase):
+    """ Library API used from a caller that owns stdout. """
+
+    def setUp(self):
+        self.inputs = [os.path.join(TEST_DATA, 't1.vcf'), os.path.join(TEST_DATA, 't2.vcf')]
+
+    def test_combine_writes_nothing_on_stdout(self):
+        for keep_different_format in (False, True):
+            with self.subTest(keep_different_format=keep_different_format):
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    lines = list(combine(self.inputs, samples=['NORMAL', 'TUMOR'],
+                                         keep_different_format=keep_different_format, lines=True, header=True))
+                    sink = io.BytesIO()
+                    write_combined(self.inputs, sink, samples=['NORMAL', 'TUMOR'],
+                                   keep_different_format=keep_different_format)
+                self.assertEqual(stdout.getvalue(), '')
+                self.assertGreater(len(lines), 1)
+                self.assertEqual(''.join(lines).encode('utf-8'), sink.getvalue())
+
+    def test_writing_options(self):
+        with self.assertRaisesRegex(TypeError, 'Options used only by write_combined: processes'):
+            list(combine(self.inputs, samples=['NORMAL', 'TUMOR'], processes='2'))
+        sink = io.BytesIO()
+        write_combined(self.inputs, sink, samples=['NORMAL', 'TUMOR'], processes='2')
+        self.assertEqual(sink.getvalue().decode('utf-8'), ''.join(combine(self.inputs, samples=['NORMAL', 'TUMOR'],
+                                                                          lines=True, header=True)))
+
+    def test_invalid_position(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path_to_invalid = os.path.join(directory, 'invalid.vcf')
+            with open(self.inputs[1]) as input_file, open(path_to_invalid, 'w') as invalid_file:
+                lines = input_file.readlines()
+                body_start = next(index for index, line in enumerate(lines) if not line.startswith('#'))
+                fields = lines[body_start + 1].split('\t')
+                lines[body_start + 1] = '\t'.join(fields[:1] + ['abc'] + fields[2:])
+                invalid_file.writelines(lines)
+            inputs = [self.inputs[0], path_to_invalid]
+            message = f'Invalid body in input_vcf_file: {path_to_invalid}, POS abc is not a number.'
+            for options in ({}, {'streaming': True}, {'processes': '2'}):
+                with self.subTest(**options):
+                    with self.assertRaises(ValueError) as context:
+                        write_combined(inputs, io.BytesIO(), samples=['NORMAL', 'TUMOR'], **options)
+                    self.assertEqual(str(context.exception), message)
+            with self.assertRaises(ValueError) as context:
+                list(combine(inputs, samples=['NORMAL', 'TUMOR']))
+            self.assertEqual(str(context.exception), message)
+
+    def test_truncated_input(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path_to_vcf = os.path.join(directory, 'long.vcf')
+            with open(path_to_vcf, 'w') as vcf_file:
+                vcf_file.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+                vcf_file.writelines(f'{chrom}\t{position}\t.\tA\tG\t50\tPASS\tDP={position % 97}\n'
+                                    for chrom in ('1', '2') for position in range(1, 20001))
+            path_to_truncated = os.path.join(directory, 'truncated.vcf.gz')
+            subprocess.run([sys.executable, SMART_COMBINE_VARIANTS, '-i', path_to_vcf, '-f', 'COMPRESSED', '-o',
+                            path_to_truncated, '--write_index'], check=True)
+            with open(path_to_truncated, 'r+b') as truncated_file:
+                truncated_file.truncate(os.path.getsize(path_to_truncated) // 2)
+            path_to_index = path_to_truncated + '.tbi'
+            os.rename(path_to_index, path_to_index + '.old')
+            self.check_unreadable_input([path_to_vcf, path_to_truncated], path_to_truncated)
+            os.rename(path_to_index + '.old', path_to_index)
+            os.utime(path_to_index, (os.path.getmtime(path_to_truncated) + 1,) * 2)
+            self.check_unreadable_input([path_to_vcf, path_to_truncated], path_to_truncated)
+
+    def check_unreadable_input(self, inputs, path_to_unreadable):
+        """ Checks that combining fails with the error of the input file that can't be read in all modes. """
+        for options in ({}, {'streaming': True}, {'processes': '2'}):
+            with self.subTest(index=os.path.isfile(path_to_unreadable + '.tbi'), **options):
+                with self.assertRaises(ValueError) as context:
+                    write_combined(inputs, io.BytesIO(), **options)
+                self.assertTrue(str(context.exception).startswith(
+                    f'Invalid body in input_vcf_file: {path_to_unreadable}, '), str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
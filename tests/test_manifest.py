@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SMART_COMBINE_VARIANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smart_combine_variants.py')
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'test')
+
+
+class Test_manifest(unittest.TestCase):
+    """ Batch mode with --manifest and its exit status. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.inputs = ','.join([os.path.join(TEST_DATA, 't1.vcf'), os.path.join(TEST_DATA, 't2.vcf')])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_manifest(self, jobs, *arguments):
+        """ Writes the manifest with jobs given as lists of fields, runs it and returns the completed process. """
+        path_to_manifest = os.path.join(self.directory.name, 'jobs.tsv')
+        with open(path_to_manifest, 'w') as manifest_file:
+            manifest_file.writelines('\t'.join(job) + '\n' for job in jobs)
+        return subprocess.run([sys.executable, SMART_COMBINE_VARIANTS, '--manifest', path_to_manifest] +
+                              list(arguments), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+
+    def test_all_jobs_succeed(self):
+        jobs = [[os.path.join(self.directory.name, f'out{job}.vcf'), self.inputs, 'NORMAL,TUMOR'] for job in range(2)]
+        process = self.run_manifest(jobs, '--processes', '2')
+        self.assertEqual(process.returncode, 0, process.stdout + process.stderr)
+        self.assertIn('2 jobs, 0 failed', process.stdout)
+        for output, _, _ in jobs:
+            self.assertTrue(os.path.isfile(output))
+
+    def test_failed_job(self):
+        jobs = [[os.path.join(self.directory.name, 'out.vcf'), self.inputs, 'NORMAL,TUMOR'],
+                [os.path.join(self.directory.name, 'missing.vcf'),
+                 os.path.join(self.directory.name, 'missing_input.vcf')]]
+        process = self.run_manifest(jobs)
+        self.assertEqual(process.returncode, 1, process.stdout + process.stderr)
+        self.assertIn('2 jobs, 1 failed', process.stdout)
+
+    def test_invalid_manifest(self):
+        process = self.run_manifest([[os.path.join(self.directory.name, 'out.vcf')]])
+        self.assertEqual(process.returncode, 1, process.stdout + process.stderr)
+        self.assertIn('Invalid line 1 in manifest', process.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
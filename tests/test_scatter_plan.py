@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from generate_vcf import generate_vcf_files
+
+SMART_COMBINE_VARIANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smart_combine_variants.py')
+
+
+def run_smart_combine_variants(*arguments):
+    """ Starts smart_combine_variants.py with arguments in a new process and returns the process. """
+    return subprocess.Popen([sys.executable, SMART_COMBINE_VARIANTS] + list(arguments), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def check_smart_combine_variants(test_case, *arguments):
+    """ Runs smart_combine_variants.py with arguments and checks that it printed nothing to stdout. """
+    stdout, stderr = run_smart_combine_variants(*arguments).communicate()
+    test_case.assertEqual(stdout, '', stderr)
+
+
+class Test_scatter_plan(unittest.TestCase):
+    """ Scatter command, merging of shards in separate processes and gathering of their chunks. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = generate_vcf_files(self.directory.name, inputs=3, contigs=5, records=300)
+        self.input_arguments = [argument for path in self.paths for argument in ('-i', path)]
+        self.path_to_plan = os.path.join(self.directory.name, 'plan.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scatter(self, shards):
+        """ Writes the scatter plan of the input files with the number of shards and returns the plan. """
+        check_smart_combine_variants(self, 'scatter', *self.input_arguments, '-s', 'SAMPLE1,SAMPLE2', '--shards',
+                                     str(shards), '-o', self.path_to_plan)
+        with open(self.path_to_plan) as plan_file:
+            return json.load(plan_file)
+
+    def test_plan_lists_every_input_file_once(self):
+        plan = self.scatter(3)
+        self.assertEqual(plan['input_files'], [os.path.abspath(path) for path in self.paths])
+        self.assertEqual(plan['samples'], ['SAMPLE1', 'SAMPLE2'])
+        self.assertEqual(len(plan['shards']), 3)
+        self.assertEqual([chrom for shard in plan['shards'] for chrom in shard], ['1', '2', '3', '4', '5'])
+
+    def test_plan_keeps_repeated_input_file(self):
+        self.input_arguments += ['-i', self.paths[0]]
+        plan = self.scatter(2)
+        self.assertEqual(plan['input_files'], [os.path.abspath(path) for path in self.paths + self.paths[:1]])
+
+    def test_gathered_shards_are_the_combined_file(self):
+        for output_format, extension in (('UNCOMPRESSED', '.vcf'), ('COMPRESSED', '.vcf.gz')):
+            with self.subTest(output_format=output_format):
+                plan = self.scatter(3)
+                paths_of_chunks = [os.path.join(self.directory.name, f'shard{shard}{extension}')
+                                   for shard in range(len(plan['shards']))]
+                processes = [run_smart_combine_variants('--plan', self.path_to_plan, '--shard', str(shard), '-f',
+                                                        output_format, '-o', path_of_chunk)
+                             for shard, path_of_chunk in enumerate(paths_of_chunks)]
+                for process in processes:
+                    stdout, stderr = process.communicate()
+                    self.assertEqual(stdout, '', stderr)
+
+                path_of_gathered = os.path.join(self.directory.name, 'gathered' + extension)
+                check_smart_combine_variants(self, 'gather', '-o', path_of_gathered, *paths_of_chunks)
+                path_of_combined = os.path.join(self.directory.name, 'combined' + extension)
+                check_smart_combine_variants(self, *self.input_arguments, '-s', 'SAMPLE1,SAMPLE2', '-f',
+                                             output_format, '-o', path_of_combined)
+
+                open_file = gzip.open if output_format == 'COMPRESSED' else open
+                with open_file(path_of_gathered, 'rb') as gathered_file, \
+                        open_file(path_of_combined, 'rb') as combined_file:
+                    self.assertEqual(gathered_file.read(), combined_file.read())
+
+    def test_scatter_requires_shards(self):
+        stdout, _ = run_smart_combine_variants('scatter', *self.input_arguments, '-o', self.path_to_plan).communicate()
+        self.assertIn('--shards', stdout)
+        self.assertFalse(os.path.exists(self.path_to_plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
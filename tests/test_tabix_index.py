@@ -0,0 +1,101 @@
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bgzf_reader import Bgzf_reader
+from tabix_index import Tabix_index
+from tabix_index_writer import Tabix_index_writer
+
+SMART_COMBINE_VARIANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smart_combine_variants.py')
+
+TBI_MAX_POSITION = 1 << 29
+
+
+class Test_tabix_index(unittest.TestCase):
+    """ Round trip of the index written with --write_index: region queries through the index read back with
+        Tabix_index must return the same records as a scan of the whole output file. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_indexed_output(self, positions_of_chromosomes):
+        """ Writes input VCF file with records at the positions, combines it into a compressed output file with
+            --write_index and returns the path to the output file. Every 50th record is a deletion spanning 5 kb
+            with END in INFO.
+        :param positions_of_chromosomes: list of (chrom, positions) in the order of the file
+        """
+        path_to_input = os.path.join(self.directory.name, 'input.vcf')
+        with open(path_to_input, 'w') as vcf_file:
+            vcf_file.write('##fileformat=VCFv4.2\n')
+            for chrom, positions in positions_of_chromosomes:
+                vcf_file.write(f'##contig=<ID={chrom},length={positions[-1] + 10000}>\n')
+            vcf_file.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+            for chrom, positions in positions_of_chromosomes:
+                for index, position in enumerate(positions):
+                    if index % 50 == 0:
+                        vcf_file.write(f'{chrom}\t{position}\t.\tACGT\tA\t50\tPASS\tEND={position + 5000}\n')
+                    else:
+                        vcf_file.write(f'{chrom}\t{position}\t.\tA\tG\t50\tPASS\tDP={index % 97}\n')
+        path_to_output = os.path.join(self.directory.name, 'output.vcf.gz')
+        subprocess.run([sys.executable, SMART_COMBINE_VARIANTS, '-i', path_to_input, '-f', 'COMPRESSED', '-o',
+                        path_to_output, '--write_index'], check=True, stdout=subprocess.PIPE)
+        return path_to_output
+
+    @staticmethod
+    def overlaps(line, chrom, beg, end):
+        """ Checks whether the VCF line is on chrom and overlaps 0-based half-open interval [beg, end). """
+        fields = line.split(b'\t')
+        record_beg, record_end = Tabix_index_writer.interval_of_vcf_record(fields[1], fields[3], str(fields[7],
+                                                                                                     'utf-8'))
+        return fields[0] == chrom.encode('utf-8') and record_beg < end and record_end > beg
+
+    @staticmethod
+    def query_index(path, tabix_index, chrom, beg, end):
+        """ Returns lines of records overlapping the region read only from the chunks given by the index. """
+        lines = []
+        with Bgzf_reader(path) as reader:
+            for start, stop in tabix_index.chunks_of_regions(chrom, [(beg, end)]):
+                reader.seek(start)
+                while reader.tell() < stop:
+                    lines.append(reader.readline())
+        return [line for line in lines if Test_tabix_index.overlaps(line, chrom, beg, end)]
+
+    def check_regions(self, path, extension, regions):
+        """ Checks that the index with the extension is written next to the output file and that every region
+            query through it returns the records found by scanning the whole output file. """
+        self.assertTrue(os.path.isfile(path + extension))
+        self.assertFalse(os.path.isfile(path + ('.tbi' if extension == '.csi' else '.csi')))
+        tabix_index = Tabix_index(path + extension, ['1', '2'])
+        self.assertEqual(tabix_index.csi, extension == '.csi')
+        with gzip.open(path) as output_file:
+            lines = [line for line in output_file if not line.startswith(b'#')]
+        for chrom, beg, end in regions:
+            with self.subTest(chrom=chrom, beg=beg, end=end):
+                expected_lines = [line for line in lines if self.overlaps(line, chrom, beg, end)]
+                self.assertEqual(self.query_index(path, tabix_index, chrom, beg, end), expected_lines)
+
+    def test_tbi(self):
+        path = self.write_indexed_output([('1', range(1, 300001, 7)), ('2', range(100, 200001, 13))])
+        self.check_regions(path, '.tbi', [('1', 0, 1), ('1', 16383, 16385), ('1', 100000, 100500),
+                                          ('1', 150000, 250000), ('1', 299990, 400000), ('2', 0, 200100),
+                                          ('2', 120000, 120013), ('3', 0, 1000)])
+
+    def test_csi(self):
+        path = self.write_indexed_output([('1', range(1, 100001, 7)),
+                                          ('2', range(TBI_MAX_POSITION - 100000, TBI_MAX_POSITION + 100000, 11))])
+        self.check_regions(path, '.csi', [('1', 50000, 50100), ('2', 0, TBI_MAX_POSITION - 90000),
+                                          ('2', TBI_MAX_POSITION - 1000, TBI_MAX_POSITION + 1000),
+                                          ('2', TBI_MAX_POSITION + 50000, TBI_MAX_POSITION + 50001),
+                                          ('2', TBI_MAX_POSITION + 99990, TBI_MAX_POSITION * 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import gzip
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bgzf_writer import Bgzf_writer
+
+SMART_COMBINE_VARIANTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'smart_combine_variants.py')
+
+HEADER = '##fileformat=VCFv4.2\n' \
+         '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n' \
+         '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE1\n'
+
+VALID_RECORDS = [('1', '100', 'A', 'G'), ('1', '200', 'C', 'T'), ('2', '50', 'G', 'A')]
+
+
+class Test_validate(unittest.TestCase):
+    """ Checks of --validate_only and its exit status. """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_vcf(self, name, records):
+        """ Writes VCF file with one sample and records given as (CHROM, POS, REF, ALT) and returns its path. """
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as vcf_file:
+            vcf_file.write(HEADER)
+            for chrom, pos, ref, alt in records:
+                vcf_file.write(f'{chrom}\t{pos}\t.\t{ref}\t{alt}\t50\tPASS\tDP=10\tGT\t0/1\n')
+        return path
+
+    def validate(self, *paths):
+        """ Runs smart_combine_variants.py --validate_only on the files and returns the completed process. """
+        arguments = [argument for path in paths for argument in ('-i', path)]
+        return subprocess.run([sys.executable, SMART_COMBINE_VARIANTS] + arguments + ['--validate_only'],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+    def check_invalid(self, records, line_number, message):
+        """ Checks that validation of the file with records fails on the body line with the message and exit status 1.
+        """
+        path_to_valid = self.write_vcf('valid.vcf', VALID_RECORDS)
+        path_to_invalid = self.write_vcf('invalid.vcf', records)
+        process = self.validate(path_to_valid, path_to_invalid)
+        self.assertEqual(process.returncode, 1, process.stderr)
+        self.assertIn(f'Invalid body line {line_number} in input_vcf_file: {path_to_invalid}, {message}.',
+                      process.stdout)
+
+    def test_valid_files(self):
+        process = self.validate(self.write_vcf('valid1.vcf', VALID_RECORDS),
+                                self.write_vcf('valid2.vcf', VALID_RECORDS[:2]))
+        self.assertEqual(process.returncode, 0, process.stdout + process.stderr)
+
+    def test_same_ref_and_alt(self):
+        self.check_invalid([('1', '100', 'A', 'G'), ('1', '200', 'C', 'C')], 2, 'record has same REF and ALT field')
+
+    def test_unsorted_positions(self):
+        self.check_invalid([('1', '200', 'A', 'G'), ('1', '100', 'C', 'T')], 2,
+                           'records of chromosome 1 are not sorted by position')
+
+    def test_non_contiguous_chromosomes(self):
+        self.check_invalid([('1', '100', 'A', 'G'), ('2', '50', 'C', 'T'), ('1', '300', 'G', 'A')], 3,
+                           'records of chromosome 1 are not contiguous')
+
+    def test_position_is_not_a_number(self):
+        self.check_invalid([('1', 'x100', 'A', 'G')], 1, 'POS x100 is not a number')
+
+    def test_truncated_compressed_file(self):
+        path_to_valid = self.write_vcf('valid.vcf', VALID_RECORDS)
+        with open(self.write_vcf('long.vcf', [('1', str(position), 'A', 'G') for position in range(1, 20001)]),
+                  'rb') as vcf_file:
+            data = vcf_file.read()
+        for name, compress in (('gzip', gzip.compress), ('bgzf', Bgzf_writer.compress_to_blocks)):
+            with self.subTest(name):
+                path_to_truncated = os.path.join(self.directory.name, f'truncated_{name}.vcf.gz')
+                compressed_data = compress(data)
+                with open(path_to_truncated, 'wb') as truncated_file:
+                    truncated_file.write(compressed_data[:len(compressed_data) // 2])
+                process = self.validate(path_to_valid, path_to_truncated)
+                self.assertEqual(process.returncode, 1, process.stderr)
+                self.assertNotIn('Traceback', process.stderr)
+                path = re.escape(path_to_truncated)
+                self.assertRegex(process.stdout, f'{path}: [0-9]+ records, 1 chromosomes, .*, Invalid body line '
+                                                 f'[0-9]+ in input_vcf_file: {path}, file can\'t be read: ')
+
+
+if __name__ == '__main__':
+    unittest.main()